@@ -0,0 +1,238 @@
+"""Admission control and per-tenant load shedding.
+
+Rejects requests early, with the standard error response, when a worker is overloaded or a tenant exceeds its
+limits, so that latency stays bounded for the other tenants. Three checks are made for each request:
+
+* queue time: requests that waited in front of the service (per the X-Request-Start header set by the proxy) for
+  longer than max_queue_ms are shed with a 503.
+* rate: each tenant has a token bucket refilling at tenant_rate requests per second up to tenant_burst requests
+  (tenant_rate if unset or 0); requests beyond it are rejected with a 429.
+* concurrency: each tenant may have at most tenant_concurrency requests in flight; requests beyond it are rejected
+  with a 429.
+
+Set `shared: redis` to keep the tenant limits in redis, shared by all workers through atomic scripts on a RedisStore.
+Without it, the limits are kept in each worker process and do not isolate tenants across the service: every worker
+has its own token buckets, so with N workers a tenant may make up to N times tenant_rate requests per second, and
+concurrency limits are not enforced at all, since a sync worker only ever has one request in flight. A warning is
+logged when tenant limits are set without `shared: redis`.
+
+Admission needs the tenant resolved by the auth module, so call admit() after authentication and release() at the
+end of the request:
+
+    from agaveflask.admission import admit, release
+
+    @app.before_request
+    def auth():
+        authn_and_authz()
+        admit()
+
+    @app.teardown_request
+    def release_admission(exc):
+        release()
+
+Configure the limits in the [admission] section of service.conf (see service.conf.example). Any limit set to 0 is
+disabled. Limits can be set for a specific tenant with options of the form tenant_rate.<tenant>.
+"""
+
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+from .config import Config
+from .errors import RateLimitError, ServiceUnavailableError
+from .logs import LazyLogger
+
+logger = LazyLogger(__name__)
+
+# seconds after which a shared concurrency slot that was never released (e.g. by a killed worker) is reclaimed.
+SLOT_TTL = 300
+
+
+def get_setting(name, tenant=None, default=0):
+    """Return the numeric admission setting `name`, using the tenant-specific value if there is one."""
+    value = None
+    if tenant:
+        value = Config.get('admission', '{}.{}'.format(name, tenant))
+    if value is None:
+        value = Config.get('admission', name, default)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def queue_time(header):
+    """Return the seconds a request has been queued given an X-Request-Start header value, or None if the header
+    cannot be parsed. Accepts seconds, milliseconds or microseconds since the epoch, optionally prefixed by 't='."""
+    if not header:
+        return None
+    try:
+        start = float(header.strip().lstrip('t='))
+    except ValueError:
+        return None
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return max(time.time() - start, 0)
+
+
+class TokenBucket(object):
+    """An in-process token bucket refilling at `rate` tokens per second up to `burst` tokens."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.time()
+        self._lock = threading.Lock()
+
+    def take(self, cost=1):
+        """Take `cost` tokens. Returns a tuple (allowed, wait) where wait is the number of seconds until enough
+        tokens will be available when the tokens could not be taken."""
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + max(now - self.ts, 0) * self.rate)
+            self.ts = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return True, 0.0
+            return False, (cost - self.tokens) / self.rate
+
+
+class AdmissionController(object):
+    """Enforces the admission settings for the requests handled by this process."""
+
+    def __init__(self, store=None):
+        self.store = store
+        self._store_configured = store is not None
+        self._buckets = {}
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def warn_once(self, setting, msg):
+        if setting not in self._warned:
+            self._warned.add(setting)
+            logger.warning(msg)
+
+    def get_store(self):
+        """Return the RedisStore used to share limits across workers, or None if limits are kept in process."""
+        if not self._store_configured:
+            if Config.get('admission', 'shared', '').lower() == 'redis':
+                from .store import RedisStore
+                self.store = RedisStore(Config.get('admission', 'redis_host', 'localhost'),
+                                        int(Config.get('admission', 'redis_port', 6379)),
+                                        int(Config.get('admission', 'redis_db', 0)))
+            self._store_configured = True
+        return self.store
+
+    def admit(self):
+        """Check the current request against the admission limits, raising RateLimitError or
+        ServiceUnavailableError if it should be rejected."""
+        if request.method == 'OPTIONS':
+            return
+        max_queue_ms = get_setting('max_queue_ms')
+        if max_queue_ms:
+            waited = queue_time(request.headers.get('X-Request-Start'))
+            if waited is not None and waited * 1000 > max_queue_ms:
+                logger.warning("Shedding request queued for {:.0f} ms.".format(waited * 1000))
+                raise ServiceUnavailableError(msg='The service is overloaded; please retry later.', retry_after=1)
+        tenant = getattr(g, 'tenant', None)
+        if not tenant:
+            return
+        self.check_rate(tenant)
+        self.acquire(tenant)
+
+    def check_rate(self, tenant):
+        rate = get_setting('tenant_rate', tenant)
+        if not rate:
+            return
+        burst = get_setting('tenant_burst', tenant)
+        if burst <= 0:
+            # an unset burst allows one second's worth of requests.
+            burst = rate
+        store = self.get_store()
+        if store is not None:
+            try:
+                allowed, wait = store.take_token('admission:rate:{}'.format(tenant), rate, burst)
+            except Exception as e:
+                # fail open: an unavailable redis should not take the service down with it.
+                logger.warning("Could not check shared rate limit for tenant {}: {}".format(tenant, e))
+                return
+        else:
+            self.warn_once('tenant_rate', "Tenant rate limits are kept per worker process; set shared: redis in the "
+                                          "[admission] config to enforce them across workers.")
+            with self._lock:
+                bucket = self._buckets.get(tenant)
+                if bucket is None or not (bucket.rate, bucket.burst) == (rate, burst):
+                    bucket = TokenBucket(rate, burst)
+                    self._buckets[tenant] = bucket
+            allowed, wait = bucket.take()
+        if not allowed:
+            raise RateLimitError(msg='Rate limit exceeded for tenant {}.'.format(tenant), retry_after=wait)
+
+    def acquire(self, tenant):
+        limit = get_setting('tenant_concurrency', tenant)
+        if not limit:
+            return
+        store = self.get_store()
+        if store is None:
+            self.warn_once('tenant_concurrency', "Tenant concurrency limits are not enforced; they require shared: "
+                                                 "redis in the [admission] config.")
+            return
+        member = uuid.uuid4().hex
+        key = 'admission:concurrency:{}'.format(tenant)
+        try:
+            acquired = store.acquire_slot(key, member, int(limit), SLOT_TTL)
+        except Exception as e:
+            logger.warning("Could not check shared concurrency limit for tenant {}: {}".format(tenant, e))
+            return
+        if not acquired:
+            raise RateLimitError(msg='Too many concurrent requests for tenant {}.'.format(tenant), retry_after=1)
+        g.admission_slot = (key, member)
+
+    def release(self):
+        """Release the concurrency slot held by the current request, if any."""
+        slot = getattr(g, 'admission_slot', None)
+        if slot is None:
+            return
+        g.admission_slot = None
+        key, member = slot
+        try:
+            self.get_store().release_slot(key, member)
+        except Exception as e:
+            # the slot will be reclaimed after SLOT_TTL seconds.
+            logger.warning("Could not release shared concurrency slot {}: {}".format(key, e))
+
+
+# the controller used by admit() and release(); created on first use.
+_controller = None
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+def admit():
+    """Entry point for admission control; call after authentication in a before_request function."""
+    get_controller().admit()
+
+
+def release(exc=None):
+    """Release the resources held by the current request; call from a teardown_request function."""
+    get_controller().release()
+
+
+def init_app(app, store=None):
+    """Register admit() and release() on `app`. Register the app's authentication before_request function first so
+    that the tenant is known when admit() runs. Pass `store`, a RedisStore, to share limits across workers."""
+    global _controller
+    if store is not None:
+        _controller = AdmissionController(store)
+    app.before_request(admit)
+    app.teardown_request(release)
@@ -0,0 +1,61 @@
+"""Asynchronous iteration over store change events.
+
+This module uses async/await syntax and so requires Python 3.5+; the stores import it only when awatch() is called.
+"""
+
+import asyncio
+import threading
+
+
+class AsyncWatcher(object):
+    """
+    Asynchronous iterator over the ChangeEvents of a store's watch(), for use with `async for`. The blocking watch()
+    generator runs on a dedicated thread, started on the first iteration, which stops within a second of close()
+    being called. Call close() when done with the watcher, including when the loop consuming it is cancelled.
+    """
+
+    def __init__(self, store, keys_or_prefix, timeout=None):
+        self.store = store
+        self.keys_or_prefix = keys_or_prefix
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self._queue = None
+        self._thread = None
+
+    def _put(self, loop, item):
+        try:
+            loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # the event loop was closed without closing the watcher.
+            self.stopped.set()
+
+    def _run(self, loop):
+        """Run the watch() generator, passing its events, and finally StopAsyncIteration or the error it raised, to
+        the event loop."""
+        try:
+            for event in self.store.watch(self.keys_or_prefix, self.timeout, stop=self.stopped):
+                self._put(loop, event)
+            self._put(loop, StopAsyncIteration())
+        except Exception as e:
+            self._put(loop, e)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._thread is None:
+            if self.stopped.is_set():
+                raise StopAsyncIteration
+            self._queue = asyncio.Queue()
+            self._thread = threading.Thread(target=self._run, args=(asyncio.get_event_loop(),), daemon=True)
+            self._thread.start()
+        item = await self._queue.get()
+        if isinstance(item, Exception):
+            # the watch has ended; keep it ended for later calls.
+            self._queue.put_nowait(item)
+            raise item
+        return item
+
+    def close(self):
+        """Stop the watch; the thread running it exits within a second."""
+        self.stopped.set()
@@ -2,33 +2,39 @@
 import base64
 import re
 
-from Crypto.Signature import PKCS1_v1_5
-from Crypto.PublicKey import RSA
-from Crypto.Hash import SHA256
 from flask import g, request
 import jwt
 
 from .config import Config
 from .errors import PermissionsError
 
-from logs import get_logger
-logger = get_logger(__name__)
+from .logs import LazyLogger
+logger = LazyLogger(__name__)
 
 
-jwt.verify_methods['SHA256WITHRSA'] = (
-    lambda msg, key, sig: PKCS1_v1_5.new(key).verify(SHA256.new(msg), sig))
-jwt.prepare_key_methods['SHA256WITHRSA'] = jwt.prepare_RS_key
+# whether the SHA256WITHRSA algorithm has been registered with PyJWT
+_jwt_methods_registered = False
 
 
-def get_pub_key():
-    pub_key = Config.get('web', 'apim_public_key')
-    return RSA.importKey(base64.b64decode(pub_key))
+def register_jwt_methods():
+    """Register the SHA256WITHRSA algorithm used by APIM with PyJWT. This is done on first use rather than at import
+    time so that importing this module does not load pycrypto."""
+    global _jwt_methods_registered
+    if _jwt_methods_registered:
+        return
+    from Crypto.Signature import PKCS1_v1_5
+    from Crypto.Hash import SHA256
+    jwt.verify_methods['SHA256WITHRSA'] = (
+        lambda msg, key, sig: PKCS1_v1_5.new(key).verify(SHA256.new(msg), sig))
+    jwt.prepare_key_methods['SHA256WITHRSA'] = jwt.prepare_RS_key
+    _jwt_methods_registered = True
 
 
 TOKEN_RE = re.compile('Bearer (.+)')
 
 
 def get_pub_key():
+    from Crypto.PublicKey import RSA
     pub_key = Config.get('web', 'apim_public_key')
     return RSA.importKey(base64.b64decode(pub_key))
 
@@ -97,6 +103,7 @@ def check_jwt(req):
             tenant_name = 'dev_staging'
         except KeyError:
             raise PermissionsError(msg='JWT header missing.')
+    register_jwt_methods()
     try:
         PUB_KEY = get_pub_key()
         decoded = jwt.decode(jwt_header, PUB_KEY)
@@ -37,4 +37,24 @@ def read_config(conf_file='service.conf'):
                            .format(', '.join(places)))
     return parser
 
-Config = read_config()
\ No newline at end of file
+
+class LazyConfig(object):
+    """Proxy for the service config that reads the config file on first access rather than at import time."""
+
+    def __init__(self, conf_file='service.conf'):
+        self.conf_file = conf_file
+        self._config = None
+
+    def _load(self):
+        if self._config is None:
+            self._config = read_config(self.conf_file)
+        return self._config
+
+    def get(self, section, option, default_value=None):
+        return self._load().get(section, option, default_value)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+
+Config = LazyConfig()
@@ -16,6 +16,26 @@ class DAOError(BaseAgaveflaskError):
     pass
 
 
+class CircuitOpenError(DAOError):
+    """The store's backend is unavailable: its circuit breaker is open and the operation was not attempted."""
+    def __init__(self, msg=None, code=503):
+        super(CircuitOpenError, self).__init__(msg=msg, code=code)
+
+
 class ResourceError(BaseAgaveflaskError):
     """General error in the API resource layer."""
-    pass
\ No newline at end of file
+    pass
+
+
+class RateLimitError(BaseAgaveflaskError):
+    """The request was rejected because the tenant exceeded its rate or concurrency limits."""
+    def __init__(self, msg=None, code=429, retry_after=None):
+        super(RateLimitError, self).__init__(msg=msg, code=code)
+        self.retry_after = retry_after
+
+
+class ServiceUnavailableError(BaseAgaveflaskError):
+    """The request was shed because the service is overloaded."""
+    def __init__(self, msg=None, code=503, retry_after=None):
+        super(ServiceUnavailableError, self).__init__(msg=msg, code=code)
+        self.retry_after = retry_after
@@ -0,0 +1,119 @@
+"""Request-scoped read coalescing for stores.
+
+A StoreLoader memoizes the values read from a store during a request, so repeated reads of the same key cost a single
+round trip, and batches reads that are queued together into a single get_many() call (an MGET for RedisStore and an
+$in query for MongoStore). Loaders are bound to the flask request context through get_loader(), and their memos are
+discarded at the end of the request.
+
+Basic usage is as follows:
+
+    from agaveflask import loader
+
+    loader.init_app(app)
+
+    # within a request:
+    actors = loader.get_loader(actors_store)
+    pending = [actors.defer(aid) for aid in actor_ids]  # queued, not yet read
+    values = [p.get() for p in pending]                 # all keys read in one round trip
+
+    actor = actors.load(actor_ids[0])                   # served from the memo
+
+Writes made directly to the store are not seen by a loader that has already read the key; call clear(key) after
+writing. Repeated loads of a key return the same object, so copy a value before modifying it.
+"""
+
+from flask import g
+
+# marks keys that were looked up and not found in the store.
+_MISSING = object()
+
+
+class Deferred(object):
+    """A value queued for loading by a StoreLoader; the read happens on the first call to get()."""
+
+    def __init__(self, loader, key):
+        self.loader = loader
+        self.key = key
+
+    def get(self):
+        """Return the value, reading all keys queued on the loader if necessary. Raises KeyError if the key is
+        not in the store."""
+        return self.loader.load(self.key)
+
+
+class StoreLoader(object):
+    """Deduplicates and batches reads from `store`."""
+
+    def __init__(self, store):
+        self.store = store
+        self._memo = {}
+        self._pending = []
+
+    def defer(self, key):
+        """Queue `key` to be read with the next batch and return a Deferred for its value."""
+        if key not in self._memo:
+            self._pending.append(key)
+        return Deferred(self, key)
+
+    def dispatch(self):
+        """Read all queued keys from the store in one call."""
+        keys = [key for key in dict.fromkeys(self._pending) if key not in self._memo]
+        self._pending = []
+        if not keys:
+            return
+        found = self.store.get_many(keys)
+        for key in keys:
+            self._memo[key] = found.get(key, _MISSING)
+
+    def load(self, key):
+        """Return the value under `key`, reading it along with any queued keys if it is not memoized.
+        Raises KeyError if the key is not in the store."""
+        if key not in self._memo:
+            self._pending.append(key)
+            self.dispatch()
+        value = self._memo[key]
+        if value is _MISSING:
+            raise KeyError('"{}" not found'.format(key))
+        return value
+
+    def load_many(self, keys):
+        """Return a list of the values under `keys`, reading those that are not memoized in one call.
+        Raises KeyError if any key is not in the store."""
+        keys = list(keys)
+        self._pending.extend(keys)
+        self.dispatch()
+        return [self.load(key) for key in keys]
+
+    def prime(self, key, value):
+        """Set the memoized value of `key`, e.g. after writing it to the store."""
+        self._memo[key] = value
+
+    def clear(self, key=None):
+        """Discard the memoized value of `key`, or of all keys if `key` is None."""
+        if key is None:
+            self._memo.clear()
+        else:
+            self._memo.pop(key, None)
+
+
+def get_loader(store):
+    """Return the StoreLoader for `store` bound to the current request."""
+    loaders = getattr(g, '_store_loaders', None)
+    if loaders is None:
+        loaders = {}
+        g._store_loaders = loaders
+    loader = loaders.get(id(store))
+    if loader is None:
+        loader = StoreLoader(store)
+        loaders[id(store)] = loader
+    return loader
+
+
+def teardown(exc=None):
+    """Discard the loaders, and their memos, of the current request."""
+    g._store_loaders = None
+
+
+def init_app(app):
+    """Register teardown() on `app` so that loader memos are discarded at the end of each request."""
+    app.teardown_request(teardown)
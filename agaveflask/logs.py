@@ -3,7 +3,7 @@
 import logging
 import configparser
 
-from config import Config
+from .config import Config
 
 # possible log levels
 LEVELS = ('CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG',)
@@ -32,7 +32,7 @@ def get_log_file_strategy():
     except (configparser.NoSectionError, configparser.NoOptionError):
         # default to collecting all logs to a single file
         strategy = LOG_FILE_STRATEGY_DEFAULT
-    if strategy.lower() not in LOG_FILE_STRATEGIES:
+    if strategy is None or strategy.lower() not in LOG_FILE_STRATEGIES:
         return LOG_FILE_STRATEGY_DEFAULT
     return strategy.lower()
 
@@ -50,7 +50,10 @@ def get_module_log_level(name):
             log_level = Config.get('logs', 'level')
         except configparser.NoOptionError:
             return LEVEL
-    if log_level.upper() in LEVELS:
+    if log_level is None:
+        # Config.get returns None rather than raising for missing options
+        log_level = Config.get('logs', 'level')
+    if log_level and log_level.upper() in LEVELS:
         return log_level
     else:
         return LEVEL
@@ -75,6 +78,9 @@ def get_log_file(name):
             log_file = Config.get('logs', 'file')
         except configparser.NoOptionError:
             return LOG_FILE
+    if log_file is None:
+        # Config.get returns None rather than raising for missing options
+        log_file = Config.get('logs', 'file', LOG_FILE)
     return log_file
 
 
@@ -95,3 +101,18 @@ def get_logger(name):
     logger.addHandler(handler)
     logger.info("returning a logger set to level: {} for module: {}".format(level, name))
     return logger
+
+
+class LazyLogger(object):
+    """
+    Proxy for a logger that is configured by get_logger() on first use, so that importing a module does not open
+    log files or write to them.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._logger = None
+
+    def __getattr__(self, attr):
+        if self._logger is None:
+            self._logger = get_logger(self.name)
+        return getattr(self._logger, attr)
@@ -4,9 +4,11 @@
 
 import uuid
 
+from flask import request
+
 from .utils import RequestParser
 from .config import Config
-from .errors import DAOError
+from .errors import BaseAgaveflaskError, DAOError
 
 
 def under_to_camel(value):
@@ -40,6 +42,79 @@ class DbDict(dict):
         self[key] = value
 
 
+class ParamsValidator(object):
+    """Request validator compiled once from an AgaveDAO PARAMS list.
+
+    Checks required fields, coerces types and applies defaults in a single pass over the parsed JSON body of a
+    post/put request, raising the same 400 errors as the RequestParser returned by AgaveDAO.request_parser().
+    `provided` params are never taken from the body; they must be passed by the calling code.
+    """
+
+    def __init__(self, params):
+        # (name, required, type, help, default) for each field accepted from the request
+        self.fields = tuple((name, source == 'required', typ, help, default)
+                            for name, source, attr, typ, help, default in params
+                            if source in ('required', 'optional'))
+        # (name, source, attr) for each attribute set on the DAO, in PARAMS order
+        self.steps = tuple((name, source, attr) for name, source, attr, _, _, _ in params)
+
+    def validate(self, body=None):
+        """Validate and coerce the JSON `body` (defaults to the current request's body). Returns a dict of values
+        keyed by param name."""
+        if body is None:
+            if request.get_data(cache=True).strip():
+                body = request.get_json(force=True, silent=True)
+                if body is None:
+                    raise BaseAgaveflaskError('Invalid JSON body.', 400)
+            else:
+                body = {}
+        if not isinstance(body, dict):
+            raise BaseAgaveflaskError('Request body must be a JSON object.', 400)
+        values = {}
+        for name, required, typ, help, default in self.fields:
+            try:
+                value = body[name]
+            except KeyError:
+                if required:
+                    raise BaseAgaveflaskError('Missing required parameter {}: {}'.format(name, help), 400)
+                values[name] = default() if callable(default) else default
+                continue
+            if value is not None and typ is not None:
+                try:
+                    value = typ(value)
+                except (TypeError, ValueError) as e:
+                    raise BaseAgaveflaskError('Invalid value for parameter {}: {}. {}'.format(name, help, e), 400)
+            values[name] = value
+        return values
+
+    def construct(self, cls, body=None, **kwargs):
+        """Validate `body` and construct a `cls` DAO from it. Pass values for `provided` params (and to override
+        request values) as **kwargs.
+
+        The DAO is built without a second pass through AgaveDAO.__init__, unless `cls` overrides __init__, in which
+        case the override is called with the validated values.
+        """
+        values = self.validate(body)
+        values.update(kwargs)
+        if cls.__init__ is not AgaveDAO.__init__:
+            return cls(**values)
+        obj = cls.__new__(cls)
+        for name, source, attr in self.steps:
+            if source == 'derived':
+                # derived value - check to see if already computed
+                if hasattr(obj, name):
+                    value = getattr(obj, name)
+                else:
+                    value = obj.get_derived_value(name, values)
+            else:
+                try:
+                    value = values[name]
+                except KeyError:
+                    raise DAOError("Required field {} missing.".format(name))
+            setattr(obj, attr, value)
+        return obj
+
+
 class AgaveDAO(DbDict):
     """Base Data Access Object class for Agaveflask models."""
 
@@ -66,6 +141,22 @@ class AgaveDAO(DbDict):
             parser.add_argument(name, type=typ, required=required, help=help, default=default)
         return parser
 
+    @classmethod
+    def validator(cls):
+        """Return the ParamsValidator for this class, compiling it from PARAMS on first use."""
+        # look in the class __dict__ so that subclasses do not share their parent's validator.
+        validator = cls.__dict__.get('_validator')
+        if validator is None:
+            validator = ParamsValidator(cls.PARAMS)
+            cls._validator = validator
+        return validator
+
+    @classmethod
+    def from_request(cls, body=None, **kwargs):
+        """Construct a DAO directly from the JSON body of a post/put request. Values for `provided` params should be
+        passed as **kwargs."""
+        return cls.validator().construct(cls, body, **kwargs)
+
     @classmethod
     def from_db(cls, db_json):
         """Construct a DAO from a db serialization."""
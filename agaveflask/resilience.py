@@ -0,0 +1,173 @@
+"""Timeouts, retries and circuit breaking for store backends.
+
+Every RedisStore and MongoStore operation is guarded by a circuit breaker shared by all stores on the same backend
+(host and port) in the process. Every attempt failing with a connection error or timeout counts as a failure; after
+breaker_failures consecutive failures the breaker opens and operations fail fast with a 503 CircuitOpenError, a
+DAOError, instead of blocking the worker. After breaker_reset_s seconds a single trial operation is let through; if
+it succeeds the breaker closes again. Operations must not call other guarded operations of the same store, which
+would take the trial for themselves.
+
+Idempotent operations (reads, plain writes and deletes) are retried up to `retries` times when the connection was
+refused or reset, sleeping a random, exponentially growing interval between attempts so that workers do not retry in
+lockstep, and only while the breaker is closed. Timeouts are never retried: a stalled server would otherwise block
+the worker for several timeouts per operation. Operations that are not safe to repeat, such as pop_field() and
+getset(), are never retried.
+
+Configure these settings in the [store] section of service.conf (see service.conf.example). The state of the
+breakers is available from breaker_states() for monitoring.
+"""
+
+import functools
+import random
+import threading
+import time
+
+from .config import Config
+from .errors import CircuitOpenError
+from .logs import LazyLogger
+
+logger = LazyLogger(__name__)
+
+# default values for the [store] settings
+DEFAULTS = {'socket_timeout': 5,
+            'connect_timeout': 2,
+            'retries': 2,
+            'retry_backoff_ms': 50,
+            'retry_backoff_max_ms': 1000,
+            'breaker_failures': 5,
+            'breaker_reset_s': 30}
+
+
+# the [store] settings, read from the config on first use.
+_settings = {}
+
+
+def get_setting(name):
+    """Return the numeric [store] setting `name`."""
+    value = _settings.get(name)
+    if value is None:
+        try:
+            value = float(Config.get('store', name, DEFAULTS[name]))
+        except (TypeError, ValueError):
+            value = float(DEFAULTS[name])
+        _settings[name] = value
+    return value
+
+
+def backoff(attempt):
+    """Return the seconds to sleep before retry number `attempt` (starting at 0), with full jitter."""
+    ceiling = min(get_setting('retry_backoff_max_ms'), get_setting('retry_backoff_ms') * 2 ** attempt)
+    return random.uniform(0, ceiling) / 1000
+
+
+class CircuitBreaker(object):
+    """Tracks the health of a backend and rejects operations while it is unhealthy."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(get_setting('breaker_failures'))
+        self.reset_timeout = reset_timeout or get_setting('breaker_reset_s')
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether an operation may be attempted against the backend."""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            if not self.state == self.CLOSED:
+                logger.info("Circuit breaker for {} closed.".format(self.name))
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if not self.state == self.OPEN:
+                    logger.warning("Circuit breaker for {} opened after {} failures.".format(self.name,
+                                                                                             self.failures))
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        return {'state': self.state,
+                'failures': self.failures,
+                'opened_at': self.opened_at}
+
+
+# the circuit breakers in this process, keyed by backend.
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the circuit breaker for the backend `name`, creating it if necessary."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def breaker_states():
+    """Return a dictionary mapping each backend to the state of its circuit breaker."""
+    return {name: breaker.to_dict() for name, breaker in list(_breakers.items())}
+
+
+def guarded(idempotent=False):
+    """Decorator guarding a store method with the store's circuit breaker, retrying it on retryable errors if it is
+    `idempotent`. The store must provide `breaker`, `transient_errors`, `retryable_errors` and
+    `non_retryable_errors` attributes."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            breaker = self.breaker
+            if not breaker.allow():
+                raise CircuitOpenError('{} is unavailable.'.format(breaker.name))
+            retries = int(get_setting('retries')) if idempotent else 0
+            attempt = 0
+            while True:
+                try:
+                    result = f(self, *args, **kwargs)
+                except self.transient_errors as e:
+                    breaker.record_failure()
+                    retryable = (isinstance(e, self.retryable_errors)
+                                 and not isinstance(e, self.non_retryable_errors))
+                    if attempt >= retries or not retryable or not breaker.allow():
+                        raise
+                    logger.info("Retrying {} on {} after error: {}".format(f.__name__, breaker.name, e))
+                    time.sleep(backoff(attempt))
+                    attempt += 1
+                    continue
+                except CircuitOpenError:
+                    # raised by the breaker of a nested operation, which did not reach the backend.
+                    raise
+                except Exception:
+                    # the backend responded; the error is not a sign of its health.
+                    breaker.record_success()
+                    raise
+                breaker.record_success()
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,209 @@
+"""Production server launcher for agaveflask services.
+
+Starts the service's wsgi application under gunicorn. Usage:
+
+    python -m agaveflask.serve
+
+The application is located with the same environmental variables used by entry.sh (package, module, app and port).
+Gunicorn settings are read from the [server] section of service.conf and can be overridden with environmental
+variables of the same name:
+
+* workers: number of worker processes. Default is sized from the available CPUs (see worker_count()).
+* worker_class: one of 'sync', 'threaded', 'async' (or any gunicorn worker class name). Default is 'sync'. The
+  'async' class uses gevent, which is not installed with agaveflask; services using it must add gevent to their
+  requirements.
+* threads: threads per worker for the threaded worker class. Default is 4.
+* worker_connections: maximum concurrent clients per worker for the async worker class. Default is 1000.
+* preload: whether to load the application in the master before forking. Default is 'true'. Preloading is always
+  disabled for the async (gevent and eventlet) worker classes, since the application's libraries must be imported
+  after the worker has monkey patched the standard library.
+* max_requests: recycle a worker after it has handled this many requests (0 disables). Default is 1000.
+* max_requests_jitter: random jitter added to max_requests so workers do not all recycle at once. Default is 100.
+* timeout: seconds a worker may be silent before it is killed and restarted. Default is 30.
+* graceful_timeout: seconds workers are given to finish requests on restart. Default is 30.
+* keepalive: seconds to wait for requests on a keep-alive connection. Default is 2.
+
+Send SIGHUP to the master process for a graceful rolling reload: new workers are started with freshly loaded code
+and the old workers are shut down once they finish their in-flight requests.
+"""
+
+import math
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+from gunicorn import util
+
+from .config import Config
+
+# gunicorn worker classes for each of the supported worker types.
+WORKER_CLASSES = {'sync': 'sync',
+                  'threaded': 'gthread',
+                  'async': 'gevent'}
+
+# default values for the [server] settings
+DEFAULTS = {'worker_class': 'sync',
+            'threads': 4,
+            'worker_connections': 1000,
+            'preload': 'true',
+            'max_requests': 1000,
+            'max_requests_jitter': 100,
+            'timeout': 30,
+            'graceful_timeout': 30,
+            'keepalive': 2}
+
+
+def get_setting(name, default=None):
+    """Return the setting `name` from the environment, falling back to the [server] section of the config."""
+    value = os.environ.get(name)
+    if value is None or value == '':
+        value = Config.get('server', name, DEFAULTS.get(name, default))
+    return value
+
+
+def _cgroup_cpu_limit(root='/sys/fs/cgroup'):
+    """Return the cpu limit imposed by a cgroup quota, or None if there is no quota. `root` is the cgroup
+    filesystem."""
+    # cgroup v2
+    try:
+        with open(os.path.join(root, 'cpu.max')) as f:
+            quota, period = f.read().split()[:2]
+        if quota == 'max':
+            return None
+        return int(quota) / int(period)
+    except (IOError, OSError, ValueError):
+        pass
+    # cgroup v1
+    for base in (os.path.join(root, 'cpu'), os.path.join(root, 'cpu,cpuacct')):
+        try:
+            with open(os.path.join(base, 'cpu.cfs_quota_us')) as f:
+                quota = int(f.read())
+            with open(os.path.join(base, 'cpu.cfs_period_us')) as f:
+                period = int(f.read())
+        except (IOError, OSError, ValueError):
+            continue
+        if quota > 0 and period > 0:
+            return quota / period
+        return None
+    return None
+
+
+def available_cpus():
+    """Return the number of CPUs this process may use, taking cpu affinity and any cgroup quota into account."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, int(math.ceil(limit)))
+    return max(cpus, 1)
+
+
+def worker_count(worker_type, cpus=None):
+    """Return the default number of workers for `worker_type` on a machine with `cpus` CPUs."""
+    if cpus is None:
+        cpus = available_cpus()
+    if worker_type == 'sync':
+        # sync workers block on I/O, so keep more of them than there are CPUs.
+        return 2 * cpus + 1
+    # threaded and async workers handle concurrency within each worker.
+    return cpus + 1
+
+
+def build_options():
+    """Return a dictionary of gunicorn settings built from the environment and the config."""
+    worker_type = get_setting('worker_class')
+    worker_class = WORKER_CLASSES.get(worker_type, worker_type)
+    workers = get_setting('workers')
+    if workers:
+        workers = int(workers)
+    else:
+        workers = worker_count(worker_type)
+    # async workers monkey patch the standard library when they start, so the application must not be imported first.
+    async_worker = worker_type == 'async' or worker_class in ('gevent', 'eventlet')
+    options = {'bind': ':{}'.format(get_setting('port', 5000)),
+               'workers': workers,
+               'worker_class': worker_class,
+               'preload_app': get_setting('preload').lower() == 'true' and not async_worker,
+               'max_requests': int(get_setting('max_requests')),
+               'max_requests_jitter': int(get_setting('max_requests_jitter')),
+               'timeout': int(get_setting('timeout')),
+               'graceful_timeout': int(get_setting('graceful_timeout')),
+               'keepalive': int(get_setting('keepalive')),
+               'post_fork': post_fork}
+    if worker_class == 'gthread':
+        options['threads'] = int(get_setting('threads'))
+    elif async_worker:
+        options['worker_connections'] = int(get_setting('worker_connections'))
+    return options
+
+
+def post_fork(server, worker):
+    """Rebuild store connections in each worker so that no sockets are shared with the master."""
+    # only services that have created stores need their connections reset.
+    store = sys.modules.get('agaveflask.store')
+    if store:
+        store.reset_connections()
+
+
+def is_service_module(module, package=None):
+    """Return whether `module` is part of the service's own code in the directory `package` (default: the current
+    directory, which main() changes to the service's package) rather than a library installed there."""
+    path = getattr(module, '__file__', None)
+    if not path:
+        return False
+    path = os.path.abspath(path)
+    package = os.path.abspath(package or os.getcwd())
+    return (path.startswith(package + os.sep)
+            and not any(part in ('site-packages', 'dist-packages') for part in path.split(os.sep)))
+
+
+class AgaveApplication(BaseApplication):
+    """Gunicorn application for an agaveflask service."""
+
+    def __init__(self, app_uri, options=None):
+        self.app_uri = app_uri
+        self.options = options or {}
+        # the service's modules imported by load(), which reload() drops.
+        self.app_modules = []
+        super(AgaveApplication, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        before = set(sys.modules)
+        app = util.import_app(self.app_uri)
+        self.app_modules = [name for name in set(sys.modules) - before if is_service_module(sys.modules[name])]
+        return app
+
+    def unload(self):
+        """Drop the service's modules imported by load(), so that the application is next loaded from fresh code.
+        Libraries, including agaveflask and any installed in the service's directory, are kept."""
+        for name in self.app_modules:
+            sys.modules.pop(name, None)
+        self.app_modules = []
+
+    def reload(self):
+        super(AgaveApplication, self).reload()
+        if self.cfg.preload_app:
+            # drop the preloaded application so the new workers run fresh code.
+            self.callable = None
+            self.unload()
+
+
+def main():
+    package = get_setting('package', '/service')
+    module = get_setting('module', 'api')
+    app = get_setting('app', 'app')
+    os.chdir(package)
+    if package not in sys.path:
+        sys.path.insert(0, package)
+    AgaveApplication('{}:{}'.format(module, app), build_options()).run()
+
+
+if __name__ == '__main__':
+    main()
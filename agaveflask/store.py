@@ -1,19 +1,103 @@
 
-import collections
+from collections import namedtuple
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+import copy
 from datetime import datetime
 import json
+import re
+import threading
+import time
+import weakref
 
 import configparser
 import redis
-from pymongo import MongoClient
-
-from config import Config
+from pymongo import DeleteOne, MongoClient, UpdateOne
+from pymongo.errors import (AutoReconnect, BulkWriteError, ConnectionFailure, OperationFailure,
+                            ServerSelectionTimeoutError)
+try:
+    from pymongo.errors import NetworkTimeout
+except ImportError:
+    # added in later pymongo versions; older versions raise AutoReconnect for socket timeouts
+    NetworkTimeout = ServerSelectionTimeoutError
+
+from .config import Config
+from .errors import DAOError
+from .logs import LazyLogger
+from . import tracing
+from .resilience import get_breaker, get_setting, guarded
+from .tracing import traced
+
+logger = LazyLogger(__name__)
+
+
+# all stores created in this process, keyed by id, so that their connections can be rebuilt after a fork.
+_STORES = weakref.WeakValueDictionary()
+
+
+def reset_connections():
+    """Rebuild the client connections of every store in this process. Call in a worker process after forking,
+    since client sockets (and MongoClient's background threads) must not be shared with the parent."""
+    for store in list(_STORES.values()):
+        store.reconnect()
+
+
+# Lua script implementing an atomic token bucket.
+# KEYS[1]: bucket hash; ARGV: rate (tokens/second), burst, now (seconds), cost.
+# Returns {allowed (0 or 1), seconds to wait until `cost` tokens are available}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+# Lua script acquiring one of `limit` concurrency slots held in a sorted set scored by acquisition time.
+# KEYS[1]: slots sorted set; ARGV: member, limit, now (seconds), ttl (seconds after which a slot is considered
+# leaked by a dead worker). Returns 1 if the slot was acquired, 0 otherwise.
+ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+return 1
+"""
 
 
 def _do_get(getter, key):
     obj = getter(key)
     if obj is None:
         raise KeyError('"{}" not found'.format(key))
+    return _decode(obj)
+
+
+def _decode(obj):
+    tracing.add_payload(len(obj))
     try:
         return json.loads(obj.decode('utf-8'))
     # handle non-JSON data
@@ -22,14 +106,92 @@ def _do_get(getter, key):
 
 
 def _do_set(setter, key, value):
-    obj = json.dumps(value)
-    setter(key, obj.encode('utf-8'))
+    obj = json.dumps(value).encode('utf-8')
+    tracing.add_payload(len(obj))
+    setter(key, obj)
 
 class StoreMutexException(Exception):
     pass
 
 
-class AbstractStore(collections.MutableMapping):
+# A change to the value under `key`. `op` names the change: 'set' or 'del', or for redis keyspace notifications, the
+# name of the redis event (e.g. 'expired').
+ChangeEvent = namedtuple('ChangeEvent', ['key', 'op'])
+
+
+def _watch_target(keys_or_prefix):
+    """Return a tuple (keys, prefix) for the argument to watch(): a string is a prefix and anything else is an
+    iterable of keys."""
+    if isinstance(keys_or_prefix, str):
+        return None, keys_or_prefix
+    return list(keys_or_prefix), None
+
+
+def _glob_escape(prefix):
+    """Return `prefix` with the characters special to redis glob patterns escaped."""
+    return re.sub(r'([*?\[\]\\])', r'\\\1', prefix)
+
+
+def _remaining(deadline):
+    """Return the seconds left until `deadline` (None meaning never), or 0 if it has passed."""
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+# marks keys that do not exist in the store at the start of a transaction.
+_MISSING = object()
+
+# times a transaction is attempted before giving up on conflicting concurrent writes.
+TRANSACTION_RETRIES = 10
+
+# mongo's error code for duplicate key errors.
+DUPLICATE_KEY = 11000
+
+
+class StoreTransaction(MutableMapping):
+    """
+    The keys watched by a multi-key transaction. Reading a key returns its value at the start of the transaction;
+    assigning to or deleting a key records a write that is committed with the transaction. Values read from the
+    transaction must be assigned back to it for changes made to them to be written.
+    """
+
+    def __init__(self, values):
+        self._values = values
+        self.writes = {}
+        self.deletes = set()
+
+    def _check(self, key):
+        if key not in self._values:
+            raise DAOError('Key {} is not watched by the transaction.'.format(key), 500)
+
+    def __getitem__(self, key):
+        self._check(key)
+        value = self._values[key]
+        if value is _MISSING:
+            raise KeyError('"{}" not found'.format(key))
+        return value
+
+    def __setitem__(self, key, value):
+        self._check(key)
+        self._values[key] = value
+        self.writes[key] = value
+        self.deletes.discard(key)
+
+    def __delitem__(self, key):
+        self[key]
+        self._values[key] = _MISSING
+        self.writes.pop(key, None)
+        self.deletes.add(key)
+
+    def __iter__(self):
+        return (key for key, value in self._values.items() if value is not _MISSING)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+class AbstractStore(MutableMapping):
     """A persitent dictionary."""
 
     def __getitem__(self, key):
@@ -53,6 +215,16 @@ class AbstractStore(collections.MutableMapping):
         """Set `key` to `obj` with automatic expiration of the configured seconds."""
         pass
 
+    def get_many(self, keys):
+        """Return a dictionary mapping each of `keys` found in the store to its value."""
+        result = {}
+        for key in keys:
+            try:
+                result[key] = self[key]
+            except KeyError:
+                pass
+        return result
+
     def update(self, key, field, value):
         "Atomic ``self[key][field] = value``."""
         pass
@@ -69,6 +241,15 @@ class AbstractStore(collections.MutableMapping):
         "Atomically: ``self[key] = value`` and return previous ``self[key]``."
         pass
 
+    def transaction(self, f, keys):
+        """
+        Execute a callable, f, atomically across several keys, `keys`. The callable is passed a StoreTransaction
+        holding the current values of the keys; the writes it makes to the transaction are committed together, and
+        f is called again with fresh values if any of the keys changed in the meantime. Returns the value returned
+        by f.
+        """
+        pass
+
     def mutex_acquire(self, key):
         """Try to use key as a mutex.
         Raise StoreMutexException if not available.
@@ -81,6 +262,66 @@ class AbstractStore(collections.MutableMapping):
     def mutex_release(self, key):
         self[key] = False
 
+    def reconnect(self):
+        """Discard the current client connections and create new ones."""
+        pass
+
+    def watch(self, keys_or_prefix, timeout=None, stop=None):
+        """
+        Generator yielding a ChangeEvent for each change to the watched keys. Pass a list of keys to watch those keys,
+        or a string to watch all keys starting with it. Stops after `timeout` seconds, if given, or once `stop`, a
+        threading.Event, is set.
+
+        This implementation polls the store every watch_poll_ms milliseconds; stores supporting notifications
+        override it to yield changes as soon as they happen.
+        """
+        keys, prefix = _watch_target(keys_or_prefix)
+        try:
+            interval = float(Config.get('store', 'watch_poll_ms', 500)) / 1000
+        except ValueError:
+            interval = 0.5
+        deadline = None if timeout is None else time.time() + timeout
+        stop = stop or threading.Event()
+        snapshot = self._watch_snapshot(keys, prefix)
+        while 1:
+            remaining = _remaining(deadline)
+            if remaining == 0 or stop.is_set():
+                return
+            stop.wait(interval if remaining is None else min(interval, remaining))
+            if stop.is_set():
+                return
+            current = self._watch_snapshot(keys, prefix)
+            for key, value in current.items():
+                if not snapshot.get(key) == value:
+                    yield ChangeEvent(key, 'set')
+            for key in snapshot:
+                if key not in current:
+                    yield ChangeEvent(key, 'del')
+            snapshot = current
+
+    def _watch_snapshot(self, keys, prefix):
+        """Return the JSON serialization of the values of the watched keys, by key."""
+        if keys is None:
+            keys = self._keys_with_prefix(prefix)
+        return {key: json.dumps(value, sort_keys=True, default=str) for key, value in self.get_many(keys).items()}
+
+    def _keys_with_prefix(self, prefix):
+        """Return a list of the keys starting with `prefix`. Stores override this to filter keys in the backend."""
+        return [key for key in self if key.startswith(prefix)]
+
+    def awatch(self, keys_or_prefix, timeout=None):
+        """Return an AsyncWatcher yielding the ChangeEvents of watch() to `async for` loops. Requires Python 3.5+."""
+        # imported here since the asyncwatch module's syntax needs Python 3.5+, while the rest of the store does not.
+        from .asyncwatch import AsyncWatcher
+        return AsyncWatcher(self, keys_or_prefix, timeout)
+
+    @property
+    def breaker(self):
+        """The circuit breaker for this store's backend."""
+        if self._breaker is None:
+            self._breaker = get_breaker(self.backend)
+        return self._breaker
+
 
 class AbstractTransactionalStore(AbstractStore):
     """Adds basic transactional semantics to the AbstractStore interface."""
@@ -90,43 +331,193 @@ class AbstractTransactionalStore(AbstractStore):
 
 class RedisStore(AbstractStore):
 
+    # errors indicating that the redis server is unavailable or too slow
+    transient_errors = (redis.ConnectionError, redis.TimeoutError)
+
+    # errors worth retrying: the connection was refused or reset. Timeouts are not retried, since the server is
+    # likely to still be too slow.
+    retryable_errors = (redis.ConnectionError,)
+    non_retryable_errors = ()
+
     def __init__(self, host, port, db=0):
-        self._db = redis.StrictRedis(host=host, port=port, db=db)
+        self.host = host
+        self.port = port
+        self.db = db
+        self._client = None
+        self._ex = None
+        self._scripts = {}
+        self._notifications = None
+        self._breaker = None
+        self.backend = 'redis://{}:{}'.format(host, port)
+        _STORES[id(self)] = self
+
+    @property
+    def _db(self):
+        """The redis client, created on first use."""
+        if self._client is None:
+            self._client = redis.StrictRedis(host=self.host, port=self.port, db=self.db,
+                                             socket_timeout=get_setting('socket_timeout'),
+                                             socket_connect_timeout=get_setting('connect_timeout'))
+        return self._client
+
+    @property
+    def ex(self):
+        """Expiration, in seconds, used by set_with_expiry; read from the config on first use."""
+        if self._ex is None:
+            try:
+                self._ex = int(Config.get('web', 'log_ex'))
+            except (TypeError, ValueError):
+                self._ex = -1
+        return self._ex
+
+    @property
+    def notifications(self):
+        """How changes are announced to watch(): 'publish' (the default) has the store publish a message with each
+        write, sent in the same round trip; 'keyspace' relies on redis keyspace notifications, which must be enabled on the server
+        (notify-keyspace-events) but also report writes made by other clients and expirations."""
+        if self._notifications is None:
+            self._notifications = Config.get('store', 'notifications', 'publish').lower()
+        return self._notifications
+
+    def _keyspace_notifications_enabled(self):
+        """Return whether the server publishes the keyspace notifications watch() needs, assuming so if its config
+        cannot be read (e.g. when the CONFIG command is disabled)."""
         try:
-            self.ex = int(Config.get('web', 'log_ex'))
-        except ValueError:
-            self.ex = -1
-
+            flags = self._db.config_get('notify-keyspace-events').get('notify-keyspace-events') or ''
+        except redis.ResponseError:
+            return True
+        return 'K' in flags and ('A' in flags or 'g' in flags and '$' in flags)
+
+    def reconnect(self):
+        self._client = None
+        self._scripts = {}
+
+    def _channel(self, key):
+        if self.notifications == 'publish':
+            return 'agaveflask:{}:{}'.format(self.db, key)
+        return '__keyspace@{}__:{}'.format(self.db, key)
+
+    def _notify(self, key, op, pipe=None):
+        """Publish a change to `key` when notifications are published by the store. Pass `pipe` to publish within
+        a transaction."""
+        if self.notifications == 'publish':
+            (pipe or self._db).publish(self._channel(key), op)
+
+    def _write(self, key, op, write):
+        """Make a single write to `key` by calling `write` with a client, and publish the change when notifications
+        are published by the store. The write and the notification are sent together in one round trip. Returns the
+        result of the write."""
+        if not self.notifications == 'publish':
+            return write(self._db)
+        pipe = self._db.pipeline(transaction=False)
+        write(pipe)
+        pipe.publish(self._channel(key), op)
+        return pipe.execute()[0]
+
+    def watch(self, keys_or_prefix, timeout=None, stop=None):
+        """
+        Generator yielding a ChangeEvent for each change to the watched keys, as soon as it happens. Pass a list of
+        keys to watch those keys, or a string to watch all keys starting with it. Stops after `timeout` seconds, if
+        given, or within a second of `stop`, a threading.Event, being set. Changes are received through redis
+        pub/sub; see `notifications`. When keyspace notifications are configured but not enabled on the server, the
+        store is polled instead.
+        """
+        if self.notifications == 'keyspace' and not self._keyspace_notifications_enabled():
+            logger.warning("Keyspace notifications are not enabled on {} (notify-keyspace-events); polling for "
+                           "changes instead.".format(self.backend))
+            for event in super(RedisStore, self).watch(keys_or_prefix, timeout, stop):
+                yield event
+            return
+        keys, prefix = _watch_target(keys_or_prefix)
+        channel_prefix = self._channel('')
+        pubsub = self._db.pubsub(ignore_subscribe_messages=True)
+        try:
+            if keys is None:
+                pubsub.psubscribe(self._channel(_glob_escape(prefix)) + '*')
+            else:
+                pubsub.subscribe(*[self._channel(key) for key in keys])
+            deadline = None if timeout is None else time.time() + timeout
+            while 1:
+                remaining = _remaining(deadline)
+                if remaining == 0 or stop is not None and stop.is_set():
+                    return
+                # wake up at least every second so that stopped watches end promptly.
+                message = pubsub.get_message(timeout=1.0 if remaining is None else min(remaining, 1.0))
+                if message is None or message['type'] not in ('message', 'pmessage'):
+                    continue
+                channel = message['channel'].decode('utf-8')
+                yield ChangeEvent(channel[len(channel_prefix):], message['data'].decode('utf-8'))
+        finally:
+            pubsub.close()
+
+    def _script(self, source):
+        """Return a callable for the Lua script `source`, registered with the current client."""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._db.register_script(source)
+            self._scripts[source] = script
+        return script
+
+    @traced('get')
+    @guarded(idempotent=True)
     def __getitem__(self, key):
         return _do_get(self._db.get, key)
 
+    @traced('set')
+    @guarded(idempotent=True)
     def __setitem__(self, key, value):
-        _do_set(self._db.set, key, value)
+        self._write(key, 'set', lambda client: _do_set(client.set, key, value))
 
+    @traced('delete')
+    @guarded(idempotent=True)
     def __delitem__(self, key):
-        self._db.delete(key)
+        self._write(key, 'del', lambda client: client.delete(key))
+
+    @traced('get_many')
+    @guarded(idempotent=True)
+    def get_many(self, keys):
+        """Return a dictionary mapping each of `keys` found in the store to its value, in a single MGET."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        return {key: _decode(obj) for key, obj in zip(keys, self._db.mget(keys)) if obj is not None}
 
     def __iter__(self):
         return self._db.scan_iter()
 
+    @traced('keys_with_prefix')
+    @guarded(idempotent=True)
+    def _keys_with_prefix(self, prefix):
+        return [key.decode('utf-8') for key in self._db.scan_iter(match=_glob_escape(prefix) + '*')]
+
+    @traced('len')
+    @guarded(idempotent=True)
     def __len__(self):
         return self._db.dbsize()
 
+    @traced('set_with_expiry')
+    @guarded(idempotent=True)
     def set_with_expiry(self, key, obj):
         """Set `key` to `obj` with automatic expiration of `ex` seconds."""
-        self._db.set(key, obj, ex=self.ex)
+        self._write(key, 'set', lambda client: client.set(key, obj, ex=self.ex))
 
+    @traced('update')
+    @guarded(idempotent=True)
     def update(self, key, field, value):
         "Atomic ``self[key][field] = value``."""
 
         def _update(pipe):
+            tracing.attempt()
             cur = _do_get(pipe.get, key)
             cur[field] = value
             pipe.multi()
             _do_set(pipe.set, key, cur)
+            self._notify(key, 'set', pipe)
 
         self._db.transaction(_update, key)
 
+    @traced('pop_field')
+    @guarded()
     def pop_field(self, key, field):
         "Atomic pop ``self[key][field]``."""
 
@@ -144,34 +535,46 @@ class RedisStore(AbstractStore):
 
         with self._db.pipeline() as pipe:
             while 1:
+                tracing.attempt()
                 try:
                     pipe.watch(key)
                     cur = _do_get(pipe.get, key)
                     value = cur.pop(field)
+                    pipe.multi()
                     _do_set(pipe.set, key, cur)
+                    self._notify(key, 'set', pipe)
                     pipe.execute()
                     return value
                 except redis.WatchError:
                     continue
 
+    @traced('update_subfield')
+    @guarded(idempotent=True)
     def update_subfield(self, key, field1, field2, value):
         "Atomic ``self[key][field1][field2] = value``."""
 
         def _update(pipe):
+            tracing.attempt()
             cur = _do_get(pipe.get, key)
             cur[field1][field2] = value
             pipe.multi()
             _do_set(pipe.set, key, cur)
+            self._notify(key, 'set', pipe)
 
         self._db.transaction(_update, key)
 
+    @traced('getset')
+    @guarded()
     def getset(self, key, value):
         "Atomically: ``self[key] = value`` and return previous ``self[key]``."
 
-        value = self._db.getset(key, json.dumps(value).encode('utf-8'))
+        obj = json.dumps(value).encode('utf-8')
+        value = self._write(key, 'set', lambda client: client.getset(key, obj))
         if value is not None:
             return json.loads(value.decode('utf-8'))
 
+    @traced('add_if_empty')
+    @guarded()
     def add_if_empty(self, key, field, value):
         """
         Atomic ``self[key][field] = value`` if s``self[key]`` does not exist or is empty.
@@ -179,12 +582,14 @@ class RedisStore(AbstractStore):
         or it's value is currently empty. Returns the value if it was added; otherwise, returns None.
         """
         def _transaction(pipe):
+            tracing.attempt()
             try:
                 cur = _do_get(pipe.get, key)
                 if cur is None or cur == {}:
                     cur[field] = value
                     pipe.multi()
                     _do_set(pipe.set, key, cur)
+                    self._notify(key, 'set', pipe)
                     return value
                 else:
                     return None
@@ -193,21 +598,105 @@ class RedisStore(AbstractStore):
                 obj = {field: value}
                 pipe.multi()
                 _do_set(pipe.set, key, obj)
+                self._notify(key, 'set', pipe)
             # the key exists in the store; if it is the value empty, and the field:
         return self._db.transaction(_transaction, key)
 
+    @traced('within_transaction', key_arg='key')
+    @guarded()
     def within_transaction(self, f, key):
         """Execute a callable, f, within a lock on key `key`. The executable, f, should take a single argument that
-        is the current value under the key """
-        def _transaction(pipe):
-            cur = _do_get(pipe.get, key)
-            f(cur)
+        is the current value under the key; changes it makes to the value are written back atomically. Returns the
+        value returned by f."""
+        def _apply(tx):
+            cur = tx[key]
+            before = json.dumps(cur)
+            result = f(cur)
+            if not json.dumps(cur) == before:
+                tx[key] = cur
+            return result
+
+        return self._transaction(_apply, [key])
+
+    @traced('transaction', key_arg='keys')
+    @guarded()
+    def transaction(self, f, keys):
+        """
+        Execute a callable, f, atomically across several keys, `keys`. The callable is passed a StoreTransaction
+        holding the current values of the keys; the writes it makes to the transaction are committed together in a
+        single MULTI/EXEC, and f is called again with fresh values if any of the keys changed in the meantime.
+        Returns the value returned by f. Raises a 409 DAOError if the keys keep changing for TRANSACTION_RETRIES
+        attempts.
+        """
+        return self._transaction(f, keys)
 
-        return self._db.transaction(_transaction, key)
+    def _transaction(self, f, keys):
+        """The unguarded implementation of transaction(), shared with within_transaction()."""
+        keys = list(keys)
+        with self._db.pipeline() as pipe:
+            for _ in range(TRANSACTION_RETRIES):
+                tracing.attempt()
+                try:
+                    pipe.watch(*keys)
+                    values = pipe.mget(keys)
+                    tx = StoreTransaction({key: _MISSING if value is None else _decode(value)
+                                           for key, value in zip(keys, values)})
+                    result = f(tx)
+                    if not tx.writes and not tx.deletes:
+                        # the values were read atomically by MGET; there is nothing to commit.
+                        pipe.reset()
+                        return result
+                    pipe.multi()
+                    for key, value in tx.writes.items():
+                        _do_set(pipe.set, key, value)
+                        self._notify(key, 'set', pipe)
+                    if tx.deletes:
+                        pipe.delete(*tx.deletes)
+                        for key in tx.deletes:
+                            self._notify(key, 'del', pipe)
+                    pipe.execute()
+                    return result
+                except redis.WatchError:
+                    continue
+        raise DAOError('Transaction on {} conflicted with concurrent writes.'.format(keys), 409)
+
+    @traced('take_token')
+    @guarded()
+    def take_token(self, key, rate, burst, cost=1):
+        """
+        Atomically take `cost` tokens from the token bucket stored under `key`, which refills at `rate` tokens per
+        second up to `burst` tokens. Returns a tuple (allowed, wait) where wait is the number of seconds until
+        enough tokens will be available when the tokens could not be taken.
+        """
+        allowed, wait = self._script(TOKEN_BUCKET_SCRIPT)(keys=[key], args=[rate, burst, time.time(), cost])
+        return bool(allowed), float(wait)
+
+    @traced('acquire_slot')
+    @guarded()
+    def acquire_slot(self, key, member, limit, ttl):
+        """
+        Atomically acquire one of `limit` concurrency slots under `key` for `member`. Slots held for longer than
+        `ttl` seconds are assumed to be leaked and are reclaimed. Returns True if the slot was acquired.
+        """
+        return bool(self._script(ACQUIRE_SLOT_SCRIPT)(keys=[key], args=[member, limit, time.time(), ttl]))
+
+    @traced('release_slot')
+    @guarded(idempotent=True)
+    def release_slot(self, key, member):
+        """Release the concurrency slot under `key` held by `member`."""
+        self._db.zrem(key, member)
 
 
 class MongoStore(AbstractStore):
 
+    # errors indicating that the mongo server is unavailable or too slow
+    transient_errors = (ConnectionFailure,)
+
+    # errors worth retrying: the connection was refused or reset. Timeouts are not retried, since the server is
+    # likely to still be too slow.
+    retryable_errors = (AutoReconnect,)
+    non_retryable_errors = (NetworkTimeout, ServerSelectionTimeoutError)
+
     def __init__(self, host, port, database='abaco', db='0'):
         """
         Creates an abaco `store` which maps to a single mongo
@@ -220,28 +709,76 @@ class MongoStore(AbstractStore):
 
         :return:
         """
-        mongo_uri = 'mongodb://{}:{}'.format(host, port)
-        self._mongo_client = MongoClient(mongo_uri)
-        self._mongo_database = self._mongo_client[database]
-        self._db = self._mongo_database[db]
-
+        self.host = host
+        self.port = port
+        self.database = database
+        self.db = db
+        self._mongo_client = None
+        self._breaker = None
+        self._sessions = None
+        self.backend = 'mongodb://{}:{}'.format(host, port)
+        _STORES[id(self)] = self
+
+    @property
+    def _db(self):
+        """The mongo collection, with the client created on first use."""
+        if self._mongo_client is None:
+            mongo_uri = 'mongodb://{}:{}'.format(self.host, self.port)
+            self._mongo_client = MongoClient(mongo_uri, connect=False,
+                                             socketTimeoutMS=int(get_setting('socket_timeout') * 1000),
+                                             connectTimeoutMS=int(get_setting('connect_timeout') * 1000),
+                                             serverSelectionTimeoutMS=int(get_setting('connect_timeout') * 1000))
+            self._mongo_database = self._mongo_client[self.database]
+            self._collection = self._mongo_database[self.db]
+        return self._collection
+
+    def reconnect(self):
+        self._mongo_client = None
+
+    @traced('get')
+    @guarded(idempotent=True)
     def __getitem__(self, key):
         result = self._db.find_one({'_id': key})
         if not result:
             raise KeyError()
+        tracing.add_payload_of(result[key])
         return result[key]
 
+    @traced('set')
+    @guarded(idempotent=True)
     def __setitem__(self, key, value):
+        tracing.add_payload_of(value)
         self._db.save({'_id': key, key: value})
 
+    @traced('delete')
+    @guarded(idempotent=True)
     def __delitem__(self, key):
         self._db.delete_one({'_id': key})
 
+    @traced('get_many')
+    @guarded(idempotent=True)
+    def get_many(self, keys):
+        """Return a dictionary mapping each of `keys` found in the store to its value, in a single query."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        result = {doc['_id']: doc[doc['_id']] for doc in self._db.find({'_id': {'$in': keys}})}
+        tracing.add_payload_of(result)
+        return result
+
     def __iter__(self):
         for cursor in self._db.find():
             yield cursor['_id']
         # return self._db.scan_iter()
 
+    @traced('keys_with_prefix')
+    @guarded(idempotent=True)
+    def _keys_with_prefix(self, prefix):
+        query = {'_id': {'$regex': '^{}'.format(re.escape(prefix))}}
+        return [doc['_id'] for doc in self._db.find(query, {'_id': 1})]
+
+    @traced('len')
+    @guarded(idempotent=True)
     def __len__(self):
         return self._db.count()
 
@@ -250,10 +787,14 @@ class MongoStore(AbstractStore):
             return value.decode('utf-8')
         return value
 
+    @traced('set_with_expiry')
+    @guarded(idempotent=True)
     def set_with_expiry(self, key, obj):
         """Set `key` to `obj` with automatic expiration of the configured seconds."""
         self._db.save({'_id': key, 'exp': datetime.utcnow(), key: self._prepset(obj)})
 
+    @traced('update')
+    @guarded(idempotent=True)
     def update(self, key, field, value):
         "Atomic ``self[key][field] = value``."""
         result = self._db.find_and_modify(query={'_id': key},
@@ -261,6 +802,8 @@ class MongoStore(AbstractStore):
         if not result:
             raise KeyError()
 
+    @traced('pop_field')
+    @guarded()
     def pop_field(self, key, field):
         "Atomic pop ``self[key][field]``."""
         result = self._db.find_and_modify(query={'_id': key},
@@ -268,12 +811,173 @@ class MongoStore(AbstractStore):
         result = result.get(key)
         return result[field]
 
+    @traced('update_subfield')
+    @guarded(idempotent=True)
     def update_subfield(self, key, field1, field2, value):
         "Atomic ``self[key][field1][field2] = value``."""
         self._db.update_one({'_id': key}, {'$set': {'{}.{}.{}'.format(key, field1, field2): value}})
 
+    @traced('getset')
+    @guarded()
     def getset(self, key, value):
         "Atomically: ``self[key] = value`` and return previous ``self[key]``."
         value = self._db.find_and_modify(query={'_id': key},
                                          update={key: value})
-        return value[key]
\ No newline at end of file
+        return value[key]
+
+    @traced('transaction', key_arg='keys')
+    @guarded()
+    def transaction(self, f, keys):
+        """
+        Execute a callable, f, atomically across several keys, `keys`. The callable is passed a StoreTransaction
+        holding the current values of the keys. Returns the value returned by f.
+
+        When the server and pymongo support multi-document transactions (a replica set of mongo 4.0+ or a sharded
+        cluster of mongo 4.2+, and pymongo 3.9+), the reads and writes are made in a session transaction, which is
+        retried on conflicts up to TRANSACTION_RETRIES times before a 409 DAOError is raised.
+
+        Otherwise, the writes are committed in a single ordered bulk write in which each document is only written if
+        it is unchanged since it was read. If the first document written had changed, nothing has been written and f
+        is called again with fresh values. If a later document had changed, the writes before it have already been
+        committed, so a 409 DAOError is raised instead: the writes are not atomic across documents in this case.
+        A 409 DAOError is also raised if the documents keep changing for TRANSACTION_RETRIES attempts.
+        """
+        keys = list(keys)
+        if self._sessions_supported():
+            attempts = []
+
+            def _callback(session):
+                # with_transaction() retries transient errors for up to two minutes; bound it by attempts instead.
+                if len(attempts) == TRANSACTION_RETRIES:
+                    raise DAOError('Transaction on {} conflicted with concurrent writes.'.format(keys), 409)
+                attempts.append(1)
+                return self._session_transaction(f, keys, session)
+
+            with self._db.database.client.start_session() as session:
+                return session.with_transaction(_callback)
+        for _ in range(TRANSACTION_RETRIES):
+            result, committed = self._conditional_transaction(f, keys)
+            if committed:
+                return result
+        raise DAOError('Transaction on {} conflicted with concurrent writes.'.format(keys), 409)
+
+    def watch(self, keys_or_prefix, timeout=None, stop=None):
+        """
+        Generator yielding a ChangeEvent for each change to the watched keys, as soon as it happens. Pass a list of
+        keys to watch those keys, or a string to watch all keys starting with it. Stops after `timeout` seconds, if
+        given, or within a second of `stop`, a threading.Event, being set. Uses a change stream when the server supports them (replica sets, mongo 3.6+), and otherwise falls
+        back to polling.
+        """
+        keys, prefix = _watch_target(keys_or_prefix)
+        if keys is None:
+            match = {'documentKey._id': {'$regex': '^{}'.format(re.escape(prefix))}}
+        else:
+            match = {'documentKey._id': {'$in': keys}}
+        stream = None
+        # before pymongo 3.6, collection.watch is a sub-collection rather than a method.
+        if callable(getattr(type(self._db), 'watch', None)):
+            try:
+                stream = self._db.watch([{'$match': match}], max_await_time_ms=1000)
+            except OperationFailure:
+                # the server does not support change streams.
+                pass
+        if stream is None:
+            for event in super(MongoStore, self).watch(keys_or_prefix, timeout, stop):
+                yield event
+            return
+        # try_next() returns None after max_await_time_ms without a change; older pymongo versions only block.
+        next_change = getattr(stream, 'try_next', stream.next)
+        deadline = None if timeout is None else time.time() + timeout
+        with stream:
+            while 1:
+                if _remaining(deadline) == 0 or stop is not None and stop.is_set():
+                    return
+                change = next_change()
+                if change is None:
+                    continue
+                if change['operationType'] == 'invalidate':
+                    return
+                if 'documentKey' not in change:
+                    continue
+                op = 'del' if change['operationType'] == 'delete' else 'set'
+                yield ChangeEvent(change['documentKey']['_id'], op)
+
+    def _sessions_supported(self):
+        """Return whether both pymongo and the server support multi-document transactions. The server is asked once,
+        before any transaction runs, so that a transaction's callable is never called in a session the server
+        rejects."""
+        if self._sessions is None:
+            try:
+                from pymongo.client_session import ClientSession
+            except ImportError:
+                ClientSession = None
+            if not hasattr(ClientSession, 'with_transaction'):
+                self._sessions = False
+            else:
+                info = self._db.database.client.admin.command('ismaster')
+                if info.get('setName'):
+                    # replica set members support transactions from mongo 4.0 (wire version 7).
+                    self._sessions = info.get('maxWireVersion', 0) >= 7
+                else:
+                    # mongos supports transactions from mongo 4.2 (wire version 8); standalone servers never do.
+                    self._sessions = info.get('msg') == 'isdbgrid' and info.get('maxWireVersion', 0) >= 8
+        return self._sessions
+
+    def _read_transaction(self, keys, session=None):
+        """Read `keys` and return a tuple of the values read, by key, and a StoreTransaction holding copies of them
+        that the transaction's callable can modify."""
+        kwargs = {'session': session} if session else {}
+        docs = {doc['_id']: doc[doc['_id']] for doc in self._db.find({'_id': {'$in': keys}}, **kwargs)}
+        tx = StoreTransaction({key: copy.deepcopy(docs[key]) if key in docs else _MISSING for key in keys})
+        return docs, tx
+
+    def _session_transaction(self, f, keys, session):
+        """Read `keys`, call f and write its changes within the session's transaction. Returns f's return value."""
+        tracing.attempt()
+        docs, tx = self._read_transaction(keys, session)
+        result = f(tx)
+        ops = [UpdateOne({'_id': key}, {'$set': {key: value}}, upsert=True) for key, value in tx.writes.items()]
+        ops.extend(DeleteOne({'_id': key}) for key in tx.deletes)
+        if ops:
+            self._db.bulk_write(ops, ordered=True, session=session)
+        return result
+
+    def _conditional_transaction(self, f, keys):
+        """
+        Read `keys`, call f and write its changes, each only if the document is unchanged since it was read.
+        Returns a tuple of f's return value and whether the changes were written; when they were not, nothing was
+        written. Raises a 409 DAOError if some of the changes were written before a conflict was found.
+        """
+        tracing.attempt()
+        docs, tx = self._read_transaction(keys)
+        result = f(tx)
+        # Every update is an upsert conditioned on the value read, so that a changed document fails the upsert with
+        # a duplicate key error, which stops the ordered bulk write. Deletes cannot fail, so they go last.
+        ops = []
+        for key, value in tx.writes.items():
+            if key in docs:
+                query = {'_id': key, key: docs[key]}
+            else:
+                query = {'_id': key, key: {'$exists': False}}
+            ops.append(UpdateOne(query, {'$set': {key: value}}, upsert=True))
+        ops.extend(DeleteOne({'_id': key, key: docs[key]}) for key in tx.deletes)
+        if not ops:
+            return result, True
+        try:
+            written = self._db.bulk_write(ops, ordered=True)
+        except BulkWriteError as e:
+            error = (e.details.get('writeErrors') or [{}])[0]
+            if not error.get('code') == DUPLICATE_KEY:
+                raise
+            if error.get('index') == 0:
+                return result, False
+            raise DAOError('Transaction on {} conflicted with a concurrent write after some of its writes were '
+                           'committed.'.format(keys), 409)
+        # an upsert of a document that was read means it was deleted in the meantime, and has been recreated.
+        recreated = [key for key in written.upserted_ids.values() if key in docs]
+        if recreated or written.deleted_count < len(tx.deletes):
+            if not tx.writes and not written.deleted_count:
+                return result, False
+            raise DAOError('Transaction on {} conflicted with a concurrent write after some of its writes were '
+                           'committed.'.format(keys), 409)
+        return result, True
@@ -0,0 +1,160 @@
+"""Tracing of store operations.
+
+When enabled, every RedisStore and MongoStore operation records its name, key, payload size, duration and, for the
+transactional operations, the number of times it was retried after a conflicting write. Operations slower than
+slow_op_ms are logged, and the number of store round trips and total store time of each request are kept on
+flask.g as store_round_trips and store_time_ms. Register init_app(app) to report them to clients in a Server-Timing
+response header.
+
+Configure tracing in the [store] section of service.conf:
+
+    [store]
+    trace: true
+    slow_op_ms: 100
+    timing_header: true
+
+When tracing is disabled the only overhead is a check of a module flag per operation. Iterating over a store is lazy
+and is not traced.
+"""
+
+import functools
+import inspect
+import json
+import threading
+import time
+
+from flask import g, has_request_context
+
+from .config import Config
+from .logs import LazyLogger
+
+logger = LazyLogger(__name__)
+
+# default threshold, in milliseconds, above which operations are logged.
+SLOW_OP_MS = 100
+
+# whether tracing is enabled; read from the config on first use.
+_enabled = None
+
+# threshold, in milliseconds, above which operations are logged; read from the config on first use.
+_slow_op_ms = None
+
+# holds the operation currently being traced in each thread.
+_local = threading.local()
+
+
+def is_enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = Config.get('store', 'trace', 'false').lower() == 'true'
+    return _enabled
+
+
+def enable(enabled=True, slow_op_ms=None):
+    """Enable or disable tracing, overriding the config."""
+    global _enabled, _slow_op_ms
+    _enabled = enabled
+    if slow_op_ms is not None:
+        _slow_op_ms = slow_op_ms
+
+
+def get_slow_op_ms():
+    global _slow_op_ms
+    if _slow_op_ms is None:
+        try:
+            _slow_op_ms = float(Config.get('store', 'slow_op_ms', SLOW_OP_MS))
+        except ValueError:
+            _slow_op_ms = SLOW_OP_MS
+    return _slow_op_ms
+
+
+class Operation(object):
+    """A store operation being traced."""
+
+    def __init__(self, store, name, key):
+        self.store = store
+        self.name = name
+        self.key = key
+        self.size = 0
+        self.attempts = 0
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+
+def traced(name, key_arg=0):
+    """Decorator tracing the store method it wraps as the operation `name`. `key_arg` is the position (not counting
+    self) or the name of the method's argument holding the key or keys the operation is on. Operations called from
+    within a traced operation (e.g. getset() from mutex_acquire()) are counted as part of the outer operation."""
+    def decorator(f):
+        if isinstance(key_arg, int):
+            position, keyword = key_arg, None
+        else:
+            position, keyword = list(inspect.signature(f).parameters).index(key_arg) - 1, key_arg
+
+        def get_key(args, kwargs):
+            if position < len(args):
+                return args[position]
+            return kwargs.get(keyword)
+
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            if not (_enabled if _enabled is not None else is_enabled()) or getattr(_local, 'op', None):
+                return f(self, *args, **kwargs)
+            op = Operation(self, name, get_key(args, kwargs))
+            _local.op = op
+            start = time.time()
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                _local.op = None
+                finish(op, (time.time() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+def add_payload(size):
+    """Add `size` bytes to the payload of the operation being traced, if any."""
+    op = getattr(_local, 'op', None)
+    if op:
+        op.size += size
+
+
+def add_payload_of(value):
+    """Add the JSON encoded size of `value` to the payload of the operation being traced, if any."""
+    op = getattr(_local, 'op', None)
+    if op:
+        op.size += len(json.dumps(value, default=str))
+
+
+def attempt():
+    """Record an attempt of a transaction in the operation being traced, if any."""
+    op = getattr(_local, 'op', None)
+    if op:
+        op.attempts += 1
+
+
+def finish(op, duration_ms):
+    """Record the completed operation `op`, which took `duration_ms` milliseconds."""
+    if has_request_context():
+        g.store_round_trips = getattr(g, 'store_round_trips', 0) + 1 + op.retries
+        g.store_time_ms = getattr(g, 'store_time_ms', 0) + duration_ms
+    if duration_ms >= get_slow_op_ms():
+        logger.warning("Slow store operation: {}.{} key: {} payload: {} bytes retries: {} duration: {:.1f} ms".format(
+            type(op.store).__name__, op.name, str(op.key)[:100], op.size, op.retries, duration_ms))
+
+
+def add_timing_header(response):
+    """Add a Server-Timing header with the store time and round trips of the current request to `response`."""
+    round_trips = getattr(g, 'store_round_trips', 0)
+    if round_trips:
+        response.headers['Server-Timing'] = 'store;dur={:.1f};desc="{} round trips"'.format(
+            g.store_time_ms, round_trips)
+    return response
+
+
+def init_app(app):
+    """Register add_timing_header() on `app` when the timing_header option is set in the [store] config."""
+    if Config.get('store', 'timing_header', 'false').lower() == 'true':
+        app.after_request(add_timing_header)
@@ -1,4 +1,6 @@
+import math
 import os
+import sys
 
 import flask.ext.restful.reqparse as reqparse
 from flask import jsonify, request
@@ -8,7 +10,28 @@ from flask_restful import Api
 from .config import Config
 from .errors import BaseAgaveflaskError
 
-TAG = os.environ.get('service_TAG') or Config.get('general', 'TAG')
+# the service tag reported in responses; resolved on first use by get_tag().
+_tag = None
+
+
+def get_tag():
+    """Return the service tag, read from the service_TAG environmental variable or the config."""
+    global _tag
+    if _tag is None:
+        _tag = os.environ.get('service_TAG') or Config.get('general', 'TAG')
+    return _tag
+
+
+def __getattr__(name):
+    # TAG used to be a module constant; keep it available for existing imports.
+    if name == 'TAG':
+        return get_tag()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ needs Python 3.7+; older versions resolve TAG when the module is imported, as before.
+    TAG = get_tag()
 
 
 class RequestParser(reqparse.RequestParser):
@@ -32,6 +55,9 @@ def handle_error(exc):
     if isinstance(exc, BaseAgaveflaskError):
         response = error(msg=exc.msg)
         response.status_code = exc.code
+        retry_after = getattr(exc, 'retry_after', None)
+        if retry_after is not None:
+            response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
         return response
     else:
         response = error(msg='Unrecognized exception type: {}. Exception: {}'.format(type(exc), exc))
@@ -47,13 +73,13 @@ def pretty_print(request):
 def ok(result, msg="The request was successful", request=request):
     d = {'result': result,
          'status': 'success',
-         'version': TAG,
+         'version': get_tag(),
          'message': msg}
     return jsonify(d)
 
 def error(result=None, msg="Error processing the request.", request=request):
     d = {'result': result,
          'status': 'error',
-         'version': TAG,
+         'version': get_tag(),
          'message': msg}
     return jsonify(d)
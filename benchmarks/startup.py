@@ -0,0 +1,109 @@
+"""Import-time and startup benchmark for agaveflask.
+
+Measures, in fresh interpreter processes:
+
+* import: time to import the agaveflask modules.
+* first_request: time from the start of the imports until a minimal service has answered its first request.
+* process: wall-clock time of the whole process, including interpreter startup.
+
+Usage:
+
+    python benchmarks/startup.py [--runs 10] [--budget-ms 250]
+
+With --budget-ms, exits non-zero when the median import time exceeds the budget.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICE_CONF = """[general]
+TAG: bench
+
+[web]
+access_control: none
+tenant_name: dev_staging
+show_traceback: false
+
+[logs]
+file: {log_file}
+"""
+
+# executed in a fresh interpreter for each run; prints the timings as JSON.
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import agaveflask.auth, agaveflask.models, agaveflask.store, agaveflask.utils
+t1 = time.perf_counter()
+
+from flask import Flask
+from flask_restful import Resource
+from agaveflask.auth import authn_and_authz
+from agaveflask.utils import AgaveApi, handle_error, ok
+
+app = Flask(__name__)
+api = AgaveApi(app)
+
+@app.before_request
+def auth():
+    authn_and_authz()
+
+@app.errorhandler(Exception)
+def handle_all_errors(e):
+    return handle_error(e)
+
+class Ping(Resource):
+    def get(self):
+        return ok(result='pong')
+
+api.add_resource(Ping, '/ping')
+rsp = app.test_client().get('/ping')
+assert rsp.status_code == 200, rsp.status_code
+t2 = time.perf_counter()
+print(json.dumps({'import': (t1 - t0) * 1000, 'first_request': (t2 - t0) * 1000}))
+"""
+
+
+def run_once(workdir):
+    paths = [ROOT] + [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', CHILD], cwd=workdir, env=env)
+    result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    result['process'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='number of fresh processes to measure.')
+    parser.add_argument('--budget-ms', type=float, default=None, help='maximum median import time.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'service.conf'), 'w') as f:
+            f.write(SERVICE_CONF.format(log_file=os.path.join(workdir, 'service.log')))
+        # the first run warms the bytecode cache and is not counted.
+        run_once(workdir)
+        results = [run_once(workdir) for _ in range(args.runs)]
+
+    medians = {}
+    for name in ('import', 'first_request', 'process'):
+        values = [r[name] for r in results]
+        medians[name] = statistics.median(values)
+        print('{:<14} median {:8.1f} ms   min {:8.1f} ms   max {:8.1f} ms'.format(
+            name, medians[name], min(values), max(values)))
+    if args.budget_ms is not None and medians['import'] > args.budget_ms:
+        print('import time {:.1f} ms exceeds the budget of {:.1f} ms'.format(medians['import'], args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,13 @@
 # module: name of python module (not including '.py') containing the wsgi application object.
 # app: name of the wsgi application object.
 # port: port to start the server on when running with gunicorn.
+# Gunicorn itself is configured by agaveflask.serve from the [server] section of service.conf, or from the
+# environmental variables workers, worker_class, threads, preload, max_requests, max_requests_jitter, timeout
+# and graceful_timeout.
 
 
 if [ $server = "dev" ]; then
     python3 -u "$package/$module".py
 else
-    cd $package; /usr/bin/gunicorn -w 2 -b :$port $module:$app
+    cd $package; exec python3 -m agaveflask.serve
 fi
@@ -57,6 +57,6 @@ setup(
         'Programming Language :: Python :: 3.7',
     ],
     cmdclass={'test': PyTest},
-    tests_require=['pytest'],
+    tests_require=['pytest', 'fakeredis', 'mongomock'],
     test_suite='tests',
 )
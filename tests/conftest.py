@@ -0,0 +1,47 @@
+import functools
+
+import fakeredis
+import mongomock
+import pytest
+
+from agaveflask import resilience, store, tracing
+from agaveflask.config import AgaveConfigParser, Config
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path_factory):
+    """A service config in place of service.conf, with only the log file set; tests add the options they need with
+    config.parser.read_dict()."""
+    parser = AgaveConfigParser()
+    parser.parser.read_dict({'logs': {'file': str(tmp_path_factory.getbasetemp() / 'service.log')}})
+    Config._config = parser
+    resilience._settings.clear()
+    resilience._breakers.clear()
+    yield parser
+    Config._config = None
+    resilience._settings.clear()
+    resilience._breakers.clear()
+    tracing.enable(None)
+    tracing._slow_op_ms = None
+
+
+@pytest.fixture
+def redis_server():
+    """A fakeredis server; set its `connected` attribute to False to make it refuse connections."""
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_store(monkeypatch, redis_server):
+    """A RedisStore backed by the fakeredis server."""
+    monkeypatch.setattr(store.redis, 'StrictRedis', functools.partial(fakeredis.FakeStrictRedis, server=redis_server))
+    return store.RedisStore('localhost', 6379)
+
+
+@pytest.fixture
+def mongo_store(monkeypatch):
+    """A MongoStore backed by mongomock, which supports neither sessions nor change streams."""
+    monkeypatch.setattr(store, 'MongoClient', mongomock.MongoClient)
+    mongo_store = store.MongoStore('localhost', 27017)
+    mongo_store._sessions = False
+    return mongo_store
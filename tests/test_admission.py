@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from flask import Flask, g
+
+from agaveflask.admission import AdmissionController, TokenBucket, queue_time
+from agaveflask.errors import RateLimitError, ServiceUnavailableError
+
+app = Flask(__name__)
+
+
+def admit(controller, tenant='tenant1', headers=None):
+    with app.test_request_context(headers=headers):
+        g.tenant = tenant
+        controller.admit()
+        return getattr(g, 'admission_slot', None)
+
+
+def test_queue_time_units():
+    now = time.time()
+    for header in ('{}'.format(now - 2), 't={}'.format(int((now - 2) * 1e3)), '{}'.format(int((now - 2) * 1e6))):
+        assert queue_time(header) == pytest.approx(2, abs=0.1)
+    assert queue_time('junk') is None
+    assert queue_time(None) is None
+
+
+def test_sheds_requests_queued_too_long(config):
+    config.parser.read_dict({'admission': {'max_queue_ms': 100}})
+    controller = AdmissionController()
+    admit(controller, headers={'X-Request-Start': 't={}'.format(time.time() - 0.01)})
+    with pytest.raises(ServiceUnavailableError) as e:
+        admit(controller, headers={'X-Request-Start': 't={}'.format(time.time() - 1)})
+    assert e.value.code == 503
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take() == (True, 0.0)
+    assert bucket.take() == (True, 0.0)
+    allowed, wait = bucket.take()
+    assert not allowed
+    assert 0 < wait <= 0.1
+
+
+def test_rate_limit_burst_defaults_to_rate(config):
+    config.parser.read_dict({'admission': {'tenant_rate': 3}})
+    controller = AdmissionController()
+    for _ in range(3):
+        admit(controller)
+    with pytest.raises(RateLimitError) as e:
+        admit(controller)
+    assert e.value.code == 429
+    assert e.value.retry_after > 0
+    # other tenants have their own buckets.
+    admit(controller, tenant='tenant2')
+
+
+def test_tenant_specific_limits(config):
+    config.parser.read_dict({'admission': {'tenant_rate': 1, 'tenant_rate.big': 100}})
+    controller = AdmissionController()
+    for _ in range(10):
+        admit(controller, tenant='big')
+    admit(controller)
+    with pytest.raises(RateLimitError):
+        admit(controller)
+
+
+def test_concurrency_limit_requires_shared_limits(config, caplog):
+    config.parser.read_dict({'admission': {'tenant_concurrency': 1}})
+    controller = AdmissionController()
+    admit(controller)
+    admit(controller)
+    assert caplog.text.count('concurrency limits are not enforced') == 1
+
+
+def test_rate_limit_in_process_warns(config, caplog):
+    config.parser.read_dict({'admission': {'tenant_rate': 10}})
+    controller = AdmissionController()
+    admit(controller)
+    admit(controller)
+    assert caplog.text.count('kept per worker process') == 1
+
+
+def test_shared_concurrency_limit(config, redis_store):
+    config.parser.read_dict({'admission': {'tenant_concurrency': 2}})
+    controller = AdmissionController(redis_store)
+    slots = [admit(controller), admit(controller)]
+    with pytest.raises(RateLimitError):
+        admit(controller)
+    with app.test_request_context():
+        g.admission_slot = slots[0]
+        controller.release()
+        assert g.admission_slot is None
+    admit(controller)
+
+
+def test_shared_limits(config, redis_store):
+    config.parser.read_dict({'admission': {'tenant_rate': 3, 'tenant_concurrency': 1}})
+    workers = [AdmissionController(redis_store), AdmissionController(redis_store)]
+
+    def release(worker, slot):
+        with app.test_request_context():
+            g.admission_slot = slot
+            worker.release()
+
+    slot = admit(workers[0])
+    with pytest.raises(RateLimitError):
+        admit(workers[1])
+    release(workers[0], slot)
+    release(workers[1], admit(workers[1]))
+    # the workers took the bucket's 3 tokens between them.
+    with pytest.raises(RateLimitError) as e:
+        admit(workers[0])
+    assert e.value.retry_after > 0
@@ -0,0 +1,82 @@
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from agaveflask import store, utils
+from agaveflask.config import LazyConfig
+from agaveflask.logs import LazyLogger
+
+
+def test_lazy_config_reads_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = LazyConfig('lazy-test.conf')
+    (tmp_path / 'lazy-test.conf').write_text('[web]\ncase: camel\n')
+    assert config._config is None
+    assert config.get('web', 'case') == 'camel'
+    assert config.get('web', 'missing', 'default') == 'default'
+    # the file is read once.
+    (tmp_path / 'lazy-test.conf').write_text('[web]\ncase: snake\n')
+    assert config.get('web', 'case') == 'camel'
+
+
+def test_lazy_config_missing_file_fails_on_use(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = LazyConfig('lazy-test.conf')
+    with pytest.raises(RuntimeError):
+        config.get('web', 'case')
+
+
+def test_lazy_logger_configures_on_first_use(config, tmp_path):
+    log_file = tmp_path / 'lazy.log'
+    config.parser.read_dict({'logs': {'file.lazy-test': str(log_file), 'level': 'INFO'}})
+    logger = LazyLogger('lazy-test')
+    assert not log_file.exists()
+    assert not logging.getLogger('lazy-test').handlers
+    logger.warning('first message')
+    assert 'first message' in log_file.read_text()
+
+
+def test_tag(config, monkeypatch):
+    monkeypatch.setattr(utils, '_tag', None)
+    config.parser.read_dict({'general': {'TAG': 'config-tag'}})
+    monkeypatch.delenv('service_TAG', raising=False)
+    assert utils.get_tag() == 'config-tag'
+    monkeypatch.setattr(utils, '_tag', None)
+    monkeypatch.setenv('service_TAG', 'env-tag')
+    assert utils.get_tag() == 'env-tag'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='TAG is resolved on import before Python 3.7')
+def test_tag_is_resolved_on_use(monkeypatch):
+    monkeypatch.setattr(utils, '_tag', None)
+    monkeypatch.setenv('service_TAG', 'env-tag')
+    assert utils.TAG == 'env-tag'
+    from agaveflask.utils import TAG
+    assert TAG == 'env-tag'
+
+
+def test_stores_connect_on_first_use(redis_store, mongo_store):
+    assert redis_store._client is None
+    assert mongo_store._mongo_client is None
+    redis_store['a'] = 1
+    mongo_store['a'] = 1
+    assert redis_store._client is not None
+    assert mongo_store._mongo_client is not None
+    store.reset_connections()
+    assert redis_store._client is None
+    assert mongo_store._mongo_client is None
+    assert redis_store['a'] == 1
+
+
+def test_import_reads_no_config(tmp_path):
+    # no service.conf in the working directory: importing must not need one.
+    code = 'import agaveflask.auth, agaveflask.models, agaveflask.store, agaveflask.admission, agaveflask.loader'
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(path for path in (root, env.get('PYTHONPATH')) if path)
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 0, result.stderr.decode('utf-8')
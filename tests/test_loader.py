@@ -0,0 +1,105 @@
+import pytest
+from flask import Flask, g
+
+from agaveflask import loader
+from agaveflask.loader import StoreLoader, get_loader
+
+
+class CountingStore(dict):
+    """A dict store recording the keys of each get_many() call."""
+
+    def __init__(self, *args, **kwargs):
+        super(CountingStore, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def get_many(self, keys):
+        self.calls.append(list(keys))
+        return {key: self[key] for key in keys if key in self}
+
+
+@pytest.fixture
+def store():
+    return CountingStore(actor1={'id': 'actor1'}, actor2={'id': 'actor2'}, actor3={'id': 'actor3'})
+
+
+def test_repeated_loads_read_once(store):
+    actors = StoreLoader(store)
+    assert actors.load('actor1') == {'id': 'actor1'}
+    assert actors.load('actor1') is actors.load('actor1')
+    assert store.calls == [['actor1']]
+
+
+def test_deferred_reads_are_batched(store):
+    actors = StoreLoader(store)
+    pending = [actors.defer(key) for key in ('actor1', 'actor2', 'actor1')]
+    assert store.calls == []
+    assert [p.get() for p in pending] == [{'id': 'actor1'}, {'id': 'actor2'}, {'id': 'actor1'}]
+    assert store.calls == [['actor1', 'actor2']]
+
+
+def test_load_many_reads_only_missing_keys(store):
+    actors = StoreLoader(store)
+    actors.load('actor1')
+    assert [a['id'] for a in actors.load_many(['actor1', 'actor2', 'actor3'])] == ['actor1', 'actor2', 'actor3']
+    assert store.calls == [['actor1'], ['actor2', 'actor3']]
+
+
+def test_missing_keys_raise_key_error(store):
+    actors = StoreLoader(store)
+    with pytest.raises(KeyError):
+        actors.load('missing')
+    with pytest.raises(KeyError):
+        actors.defer('missing').get()
+    with pytest.raises(KeyError):
+        actors.load_many(['actor1', 'missing'])
+    # misses are memoized too.
+    assert store.calls == [['missing'], ['actor1']]
+
+
+def test_prime_and_clear(store):
+    actors = StoreLoader(store)
+    actors.prime('actor1', {'id': 'primed'})
+    assert actors.load('actor1') == {'id': 'primed'}
+    actors.clear('actor1')
+    assert actors.load('actor1') == {'id': 'actor1'}
+    actors.clear()
+    actors.load('actor1')
+    assert store.calls == [['actor1'], ['actor1']]
+
+
+def test_loaders_are_bound_to_the_request(store):
+    app = Flask(__name__)
+    loader.init_app(app)
+    with app.test_request_context():
+        assert get_loader(store) is get_loader(store)
+        assert get_loader(store) is not get_loader(CountingStore())
+        get_loader(store).load('actor1')
+    with app.test_request_context():
+        get_loader(store).load('actor1')
+    assert store.calls == [['actor1'], ['actor1']]
+
+
+def test_teardown_drops_the_memo(store):
+    app = Flask(__name__)
+    with app.test_request_context():
+        actors = get_loader(store)
+        actors.load('actor1')
+        loader.teardown()
+        assert g._store_loaders is None
+        assert get_loader(store) is not actors
+        get_loader(store).load('actor1')
+    assert store.calls == [['actor1'], ['actor1']]
+
+
+def test_loader_over_redis_store(monkeypatch, redis_store):
+    redis_store['actor1'] = {'id': 'actor1'}
+    redis_store['actor2'] = {'id': 'actor2'}
+    mgets = []
+    mget = redis_store._db.mget
+    monkeypatch.setattr(redis_store._db, 'mget', lambda keys: mgets.append(keys) or mget(keys))
+    actors = StoreLoader(redis_store)
+    pending = [actors.defer('actor1'), actors.defer('actor2'), actors.defer('missing')]
+    assert [p.get() for p in pending[:2]] == [{'id': 'actor1'}, {'id': 'actor2'}]
+    with pytest.raises(KeyError):
+        pending[2].get()
+    assert mgets == [['actor1', 'actor2', 'missing']]
@@ -0,0 +1,106 @@
+import pytest
+from flask import Flask
+
+from agaveflask.errors import BaseAgaveflaskError, DAOError
+from agaveflask.models import AgaveDAO, ParamsValidator
+
+app = Flask(__name__)
+
+
+class Actor(AgaveDAO):
+    PARAMS = [
+        # param_name, required/optional/provided/derived, attr_name, type, help, default
+        ('image', 'required', 'image', str, 'Reference to the image.', None),
+        ('name', 'optional', 'name', str, 'User defined name.', None),
+        ('stateless', 'optional', 'stateless', bool, 'Whether the actor is stateless.', False),
+        ('maxWorkers', 'optional', 'max_workers', int, 'Maximum number of workers.', lambda: 10),
+        ('tenant', 'provided', 'tenant', str, 'The tenant.', None),
+        ('id', 'derived', 'id', str, 'Unique id of the actor.', None),
+    ]
+
+    def get_derived_value(self, name, d):
+        return '{}-{}'.format(d['tenant'], d['image'])
+
+
+class InitActor(Actor):
+    def __init__(self, **kwargs):
+        kwargs['image'] = kwargs['image'].lower()
+        super(InitActor, self).__init__(**kwargs)
+
+
+def validate(body):
+    return Actor.validator().validate(body)
+
+
+def test_required_optional_and_defaults():
+    assert validate({'image': 'abaco/test'}) == {'image': 'abaco/test', 'name': None, 'stateless': False,
+                                                 'maxWorkers': 10}
+
+
+def test_provided_and_derived_params_are_not_taken_from_the_body():
+    values = validate({'image': 'abaco/test', 'tenant': 'evil', 'id': 'chosen'})
+    assert 'tenant' not in values
+    assert 'id' not in values
+
+
+def test_type_coercion():
+    values = validate({'image': 'abaco/test', 'maxWorkers': '5', 'name': None})
+    assert values['maxWorkers'] == 5
+    assert values['name'] is None
+
+
+@pytest.mark.parametrize('body, message', [
+    ({}, 'Missing required parameter image'),
+    ({'image': 'abaco/test', 'maxWorkers': 'many'}, 'Invalid value for parameter maxWorkers'),
+    (['image'], 'Request body must be a JSON object.'),
+])
+def test_invalid_bodies(body, message):
+    with pytest.raises(BaseAgaveflaskError) as e:
+        validate(body)
+    assert e.value.code == 400
+    assert e.value.msg.startswith(message)
+
+
+def test_request_body():
+    with app.test_request_context(method='POST', data='{"image": "abaco/test"}'):
+        assert validate(None)['image'] == 'abaco/test'
+
+
+def test_empty_request_body():
+    with app.test_request_context(method='POST', data=''):
+        with pytest.raises(BaseAgaveflaskError) as e:
+            validate(None)
+    assert e.value.msg.startswith('Missing required parameter image')
+
+
+def test_malformed_request_body():
+    with app.test_request_context(method='POST', data='{"image": '):
+        with pytest.raises(BaseAgaveflaskError) as e:
+            validate(None)
+    assert e.value.code == 400
+    assert e.value.msg == 'Invalid JSON body.'
+
+
+def test_from_request():
+    actor = Actor.from_request({'image': 'abaco/test', 'maxWorkers': '2'}, tenant='dev')
+    assert actor == {'image': 'abaco/test', 'name': None, 'stateless': False, 'max_workers': 2, 'tenant': 'dev',
+                     'id': 'dev-abaco/test'}
+    assert actor == Actor(**Actor.validator().validate({'image': 'abaco/test', 'maxWorkers': '2'}), tenant='dev')
+
+
+def test_from_request_requires_provided_params():
+    with pytest.raises(DAOError) as e:
+        Actor.from_request({'image': 'abaco/test'})
+    assert e.value.msg == 'Required field tenant missing.'
+
+
+def test_from_request_calls_overridden_init():
+    actor = InitActor.from_request({'image': 'Abaco/Test'}, tenant='dev')
+    assert actor.image == 'abaco/test'
+    assert actor.id == 'dev-abaco/test'
+
+
+def test_validator_is_compiled_once_per_class():
+    assert Actor.validator() is Actor.validator()
+    assert InitActor.validator() is not Actor.validator()
+    assert isinstance(InitActor.validator(), ParamsValidator)
@@ -0,0 +1,127 @@
+import time
+
+import pytest
+import redis
+
+from agaveflask import resilience
+from agaveflask.errors import DAOError
+from agaveflask.resilience import CircuitBreaker, breaker_states, get_breaker, guarded
+
+
+class FlakyStore(object):
+    """A store whose operation fails with each of the errors in `errors` before succeeding."""
+
+    transient_errors = (redis.ConnectionError, redis.TimeoutError)
+    retryable_errors = (redis.ConnectionError,)
+    non_retryable_errors = ()
+
+    def __init__(self, errors, name='flaky'):
+        self.errors = list(errors)
+        self.breaker = get_breaker(name)
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+    @guarded(idempotent=True)
+    def read(self):
+        return self._call()
+
+    @guarded()
+    def pop(self):
+        return self._call()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(config):
+    config.parser.read_dict({'store': {'retry_backoff_ms': 1, 'retries': 2, 'breaker_failures': 3,
+                                       'breaker_reset_s': 0.1}})
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test')
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker('test')
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_lets_one_trial_through_after_reset_timeout():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_reopens_when_trial_fails():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_guarded_retries_refused_connections():
+    store = FlakyStore([redis.ConnectionError(), redis.ConnectionError()])
+    assert store.read() == 'ok'
+    assert store.calls == 3
+    assert store.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_guarded_counts_every_failed_attempt():
+    store = FlakyStore([redis.ConnectionError()] * 3)
+    with pytest.raises(redis.ConnectionError):
+        store.read()
+    assert store.calls == 3
+    assert breaker_states()['flaky']['state'] == CircuitBreaker.OPEN
+    with pytest.raises(DAOError) as e:
+        store.read()
+    assert e.value.code == 503
+    assert store.calls == 3
+
+
+def test_guarded_does_not_retry_timeouts():
+    store = FlakyStore([redis.TimeoutError()])
+    with pytest.raises(redis.TimeoutError):
+        store.read()
+    assert store.calls == 1
+
+
+def test_guarded_does_not_retry_non_idempotent_operations():
+    store = FlakyStore([redis.ConnectionError()])
+    with pytest.raises(redis.ConnectionError):
+        store.pop()
+    assert store.calls == 1
+
+
+def test_guarded_stops_retrying_when_breaker_opens(config):
+    config.parser.read_dict({'store': {'retries': 5}})
+    store = FlakyStore([redis.ConnectionError()] * 5)
+    with pytest.raises(redis.ConnectionError):
+        store.read()
+    assert store.calls == 3
+
+
+def test_backoff_is_capped(config):
+    config.parser.read_dict({'store': {'retry_backoff_ms': 100, 'retry_backoff_max_ms': 200}})
+    assert all(0 <= resilience.backoff(attempt) <= 0.2 for attempt in range(10))
@@ -0,0 +1,118 @@
+import sys
+
+import pytest
+
+from agaveflask import serve
+from agaveflask.serve import AgaveApplication, build_options, worker_count
+
+
+@pytest.mark.parametrize('worker_type, cpus, workers', [
+    ('sync', 1, 3),
+    ('sync', 4, 9),
+    ('threaded', 4, 5),
+    ('async', 2, 3),
+])
+def test_worker_count(worker_type, cpus, workers):
+    assert worker_count(worker_type, cpus) == workers
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+@pytest.mark.parametrize('files, limit', [
+    ({}, None),
+    ({'cpu.max': '150000 100000\n'}, 1.5),
+    ({'cpu.max': 'max 100000\n'}, None),
+    ({'cpu/cpu.cfs_quota_us': '200000\n', 'cpu/cpu.cfs_period_us': '100000\n'}, 2),
+    ({'cpu,cpuacct/cpu.cfs_quota_us': '50000\n', 'cpu,cpuacct/cpu.cfs_period_us': '100000\n'}, 0.5),
+    ({'cpu/cpu.cfs_quota_us': '-1\n', 'cpu/cpu.cfs_period_us': '100000\n'}, None),
+])
+def test_cgroup_cpu_limit(tmp_path, files, limit):
+    for name, content in files.items():
+        write(tmp_path / name, content)
+    assert serve._cgroup_cpu_limit(str(tmp_path)) == limit
+
+
+def test_available_cpus_honours_quota(monkeypatch):
+    monkeypatch.setattr(serve, '_cgroup_cpu_limit', lambda: 0.5)
+    assert serve.available_cpus() == 1
+
+
+@pytest.fixture
+def server_env(monkeypatch):
+    """Set [server] settings through the environment."""
+    for name in ('workers', 'worker_class', 'preload', 'threads', 'worker_connections'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(serve, 'available_cpus', lambda: 2)
+    return monkeypatch.setenv
+
+
+def test_build_options_sync(server_env):
+    options = build_options()
+    assert options['worker_class'] == 'sync'
+    assert options['workers'] == 5
+    assert options['preload_app'] is True
+    assert 'threads' not in options
+    assert 'worker_connections' not in options
+
+
+def test_build_options_threaded(server_env):
+    server_env('worker_class', 'threaded')
+    server_env('threads', '8')
+    options = build_options()
+    assert options['worker_class'] == 'gthread'
+    assert options['workers'] == 3
+    assert options['threads'] == 8
+    assert 'worker_connections' not in options
+
+
+@pytest.mark.parametrize('worker_class', ['async', 'gevent', 'eventlet'])
+def test_build_options_async_never_preloads(server_env, worker_class):
+    server_env('worker_class', worker_class)
+    server_env('preload', 'true')
+    server_env('workers', '4')
+    options = build_options()
+    assert options['preload_app'] is False
+    assert options['workers'] == 4
+    assert options['worker_connections'] == 1000
+    assert 'threads' not in options
+
+
+def test_build_options_preload_setting(config, server_env):
+    config.parser.read_dict({'server': {'preload': 'false'}})
+    assert build_options()['preload_app'] is False
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """A service package in a temporary directory, made the current directory as main() does, with a library
+    installed inside it."""
+    write(tmp_path / 'svc_api.py', 'import json\nimport svc_lib\nimport svc_models\n\n\ndef app(environ, start_response):\n    pass\n')
+    write(tmp_path / 'svc_models.py', '')
+    write(tmp_path / 'lib' / 'site-packages' / 'svc_lib.py', '')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path / 'lib' / 'site-packages'))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield tmp_path
+    for name in ('svc_api', 'svc_models', 'svc_lib'):
+        sys.modules.pop(name, None)
+
+
+def test_load_records_only_the_service_modules(service):
+    application = AgaveApplication('svc_api:app')
+    application.load()
+    assert sorted(application.app_modules) == ['svc_api', 'svc_models']
+
+
+def test_reload_drops_the_service_modules(service):
+    application = AgaveApplication('svc_api:app', {'preload_app': True})
+    first = application.wsgi()
+    application.reload()
+    assert 'svc_api' not in sys.modules
+    assert 'svc_models' not in sys.modules
+    # libraries are kept.
+    assert 'svc_lib' in sys.modules
+    assert application.wsgi() is not first
+    assert 'svc_api' in sys.modules
@@ -0,0 +1,129 @@
+import logging
+import re
+
+import pytest
+from flask import Flask, g
+
+from agaveflask import store, tracing
+from agaveflask.store import _do_get
+
+
+@pytest.fixture
+def slow_ops(caplog):
+    """Trace every operation as slow, returning the captured log."""
+    tracing.enable(True, slow_op_ms=0)
+    caplog.set_level(logging.WARNING, logger='agaveflask.tracing')
+    return caplog
+
+
+def test_slow_op_logs_transaction_keys(slow_ops, redis_store):
+    redis_store.transaction(lambda tx: None, ['actor1', 'actor2'])
+    assert "RedisStore.transaction key: ['actor1', 'actor2']" in slow_ops.text
+
+
+def test_slow_op_logs_within_transaction_key(slow_ops, redis_store):
+    redis_store['actor1'] = {}
+    redis_store.within_transaction(lambda value: None, key='actor1')
+    assert 'RedisStore.within_transaction key: actor1 ' in slow_ops.text
+    assert 'function' not in slow_ops.text
+
+
+@pytest.fixture
+def traced_app(config):
+    config.parser.read_dict({'store': {'trace': 'true', 'timing_header': 'true'}})
+    app = Flask(__name__)
+    tracing.init_app(app)
+    return app
+
+
+def test_request_counters(traced_app, redis_store):
+    with traced_app.test_request_context():
+        redis_store['actor1'] = {'status': 'READY'}
+        redis_store['actor1']
+        redis_store.get_many(['actor1', 'actor2'])
+        assert g.store_round_trips == 3
+        assert g.store_time_ms > 0
+
+
+def test_nested_operations_count_once(traced_app, redis_store):
+    with traced_app.test_request_context():
+        redis_store.mutex_acquire('lock')
+        assert g.store_round_trips == 1
+
+
+def test_server_timing_header(traced_app, redis_store):
+    @traced_app.route('/actors')
+    def actors():
+        redis_store['actor1'] = 1
+        redis_store['actor1']
+        return 'ok'
+
+    @traced_app.route('/health')
+    def health():
+        return 'ok'
+
+    client = traced_app.test_client()
+    assert re.match(r'store;dur=[\d.]+;desc="2 round trips"$', client.get('/actors').headers['Server-Timing'])
+    assert 'Server-Timing' not in client.get('/health').headers
+
+
+def test_no_timing_header_unless_configured(config):
+    app = Flask(__name__)
+    tracing.init_app(app)
+    assert not app.after_request_funcs
+
+
+def test_slow_op_threshold(config, caplog, redis_store):
+    config.parser.read_dict({'store': {'trace': 'true', 'slow_op_ms': 10000}})
+    caplog.set_level(logging.WARNING, logger='agaveflask.tracing')
+    redis_store['actor1'] = 1
+    assert 'Slow store operation' not in caplog.text
+    tracing.enable(True, slow_op_ms=0)
+    redis_store['actor1'] = 1
+    assert 'Slow store operation: RedisStore.set key: actor1 payload: 1 bytes retries: 0' in caplog.text
+
+
+def test_disabled_tracing_records_nothing(config, redis_store):
+    config.parser.read_dict({'store': {'trace': 'false'}})
+    with Flask(__name__).test_request_context():
+        redis_store['actor1'] = 1
+        assert getattr(g, 'store_round_trips', 0) == 0
+
+
+@pytest.fixture
+def conflicting(monkeypatch, redis_store):
+    """Rewrite each key, unchanged, the first time it is read within a transaction, so that the transaction's
+    WATCH fails once."""
+    rewritten = set()
+
+    def do_get(getter, key):
+        if key not in rewritten:
+            rewritten.add(key)
+            redis_store._db.set(key, redis_store._db.get(key))
+        return _do_get(getter, key)
+
+    monkeypatch.setattr(store, '_do_get', do_get)
+
+
+def test_update_retries_are_counted(traced_app, redis_store, conflicting):
+    redis_store['actor1'] = {'status': 'SUBMITTED'}
+    with traced_app.test_request_context():
+        redis_store.update('actor1', 'status', 'READY')
+        assert g.store_round_trips == 2
+    assert redis_store['actor1'] == {'status': 'READY'}
+
+
+def test_pop_field_retries_are_counted(traced_app, redis_store, conflicting):
+    redis_store['actor1'] = {'status': 'SUBMITTED'}
+    with traced_app.test_request_context():
+        assert redis_store.pop_field('actor1', 'status') == 'SUBMITTED'
+        assert g.store_round_trips == 2
+    assert redis_store['actor1'] == {}
+
+
+def test_add_if_empty_retries_are_counted(traced_app, redis_store, conflicting):
+    redis_store['actor1'] = {}
+    with traced_app.test_request_context():
+        redis_store.add_if_empty('actor1', 'status', 'READY')
+        assert g.store_round_trips == 2
+    assert redis_store['actor1'] == {'status': 'READY'}
@@ -0,0 +1,219 @@
+import time
+
+import mongomock
+import pytest
+import redis
+
+from agaveflask.errors import CircuitOpenError, DAOError
+from agaveflask.resilience import CircuitBreaker
+from agaveflask.store import TRANSACTION_RETRIES
+
+
+def transfer(tx):
+    tx['a'] = tx['a'] - 1
+    tx['b'] = tx.get('b', 0) + 1
+    return tx['b']
+
+
+def test_redis_transaction_commits_writes_and_deletes(redis_store):
+    redis_store['a'] = 5
+    redis_store['c'] = 'gone'
+
+    def f(tx):
+        del tx['c']
+        return transfer(tx)
+
+    assert redis_store.transaction(f, ['a', 'b', 'c']) == 1
+    assert redis_store.get_many(['a', 'b', 'c']) == {'a': 4, 'b': 1}
+
+
+def test_redis_transaction_reruns_on_conflict(redis_store):
+    redis_store['a'] = 5
+    calls = []
+
+    def f(tx):
+        calls.append(tx['a'])
+        if len(calls) == 1:
+            redis_store['a'] = 10
+        return transfer(tx)
+
+    redis_store.transaction(f, ['a', 'b'])
+    assert calls == [5, 10]
+    assert redis_store['a'] == 9
+
+
+def test_redis_transaction_gives_up_after_retries(redis_store):
+    redis_store['a'] = 0
+
+    def f(tx):
+        redis_store['a'] += 1
+        tx['a'] = -1
+
+    with pytest.raises(DAOError) as e:
+        redis_store.transaction(f, ['a'])
+    assert e.value.code == 409
+    assert redis_store['a'] == TRANSACTION_RETRIES
+
+
+def test_transaction_rejects_unwatched_keys(redis_store):
+    with pytest.raises(DAOError):
+        redis_store.transaction(lambda tx: tx.__setitem__('other', 1), ['a'])
+
+
+def test_mongo_transaction_commits_writes_and_deletes(mongo_store):
+    mongo_store['a'] = 5
+    mongo_store['c'] = 'gone'
+
+    def f(tx):
+        del tx['c']
+        return transfer(tx)
+
+    assert mongo_store.transaction(f, ['a', 'b', 'c']) == 1
+    assert mongo_store.get_many(['a', 'b', 'c']) == {'a': 4, 'b': 1}
+
+
+def test_mongo_transaction_allows_in_place_edits(mongo_store):
+    mongo_store._db.insert_one({'_id': 'a', 'a': {'count': 1}, 'exp': 'kept'})
+
+    def f(tx):
+        value = tx['a']
+        value['count'] += 1
+        tx['a'] = value
+
+    mongo_store.transaction(f, ['a'])
+    assert mongo_store._db.find_one({'_id': 'a'}) == {'_id': 'a', 'a': {'count': 2}, 'exp': 'kept'}
+
+
+def test_mongo_transaction_reruns_when_nothing_was_written(mongo_store):
+    mongo_store['a'] = 5
+    calls = []
+
+    def f(tx):
+        calls.append(tx['a'])
+        if len(calls) == 1:
+            mongo_store['a'] = 10
+        return transfer(tx)
+
+    mongo_store.transaction(f, ['a', 'b'])
+    assert calls == [5, 10]
+    assert mongo_store.get_many(['a', 'b']) == {'a': 9, 'b': 1}
+
+
+def test_mongo_transaction_does_not_rerun_after_partial_write(mongo_store):
+    mongo_store['a'] = 5
+    mongo_store['b'] = 0
+    calls = []
+
+    def f(tx):
+        calls.append(1)
+        mongo_store['b'] = 100
+        return transfer(tx)
+
+    with pytest.raises(DAOError) as e:
+        mongo_store.transaction(f, ['a', 'b'])
+    assert e.value.code == 409
+    assert len(calls) == 1
+    assert mongo_store['b'] == 100
+
+
+def test_mongo_transaction_detects_concurrent_create(mongo_store):
+    calls = []
+
+    def f(tx):
+        calls.append(tx.get('a'))
+        if len(calls) == 1:
+            mongo_store['a'] = 1
+        tx['a'] = tx.get('a', 0) + 1
+
+    mongo_store.transaction(f, ['a'])
+    assert calls == [None, 1]
+    assert mongo_store['a'] == 2
+
+
+def test_mongo_transaction_gives_up_after_retries(mongo_store):
+    mongo_store['a'] = 0
+
+    def f(tx):
+        mongo_store['a'] += 1
+        tx['a'] = -1
+
+    with pytest.raises(DAOError) as e:
+        mongo_store.transaction(f, ['a'])
+    assert e.value.code == 409
+    assert mongo_store['a'] == TRANSACTION_RETRIES
+
+
+@pytest.fixture
+def breaker(config, redis_store):
+    config.parser.read_dict({'store': {'retries': 0, 'breaker_failures': 2, 'breaker_reset_s': 0.05}})
+    return redis_store.breaker
+
+
+def test_within_transaction_counts_each_failure_once(breaker, redis_server, redis_store):
+    redis_server.connected = False
+    with pytest.raises(redis.ConnectionError):
+        redis_store.within_transaction(lambda value: None, 'a')
+    assert breaker.failures == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_within_transaction_on_half_open_breaker(breaker, redis_server, redis_store):
+    redis_store['a'] = {'count': 1}
+    redis_server.connected = False
+    for _ in range(2):
+        with pytest.raises(redis.ConnectionError):
+            redis_store.within_transaction(lambda value: None, 'a')
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        redis_store.within_transaction(lambda value: None, 'a')
+    assert breaker.state == CircuitBreaker.OPEN
+
+    redis_server.connected = True
+    time.sleep(0.06)
+
+    def increment(value):
+        value['count'] += 1
+        return value['count']
+
+    assert redis_store.within_transaction(increment, 'a') == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize('info, supported', [
+    ({'ismaster': True, 'maxWireVersion': 8}, False),
+    ({'ismaster': True, 'setName': 'rs0', 'maxWireVersion': 6}, False),
+    ({'ismaster': True, 'setName': 'rs0', 'maxWireVersion': 7}, True),
+    ({'ismaster': True, 'msg': 'isdbgrid', 'maxWireVersion': 7}, False),
+    ({'ismaster': True, 'msg': 'isdbgrid', 'maxWireVersion': 8}, True),
+])
+def test_mongo_sessions_supported(monkeypatch, mongo_store, info, supported):
+    monkeypatch.setattr(mongomock.database.Database, 'command', lambda self, command: info)
+    mongo_store._sessions = None
+    assert mongo_store._sessions_supported() == supported
+
+
+class RetryingSession(object):
+    """Stands in for a pymongo session whose transactions always fail with transient errors."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def with_transaction(self, callback):
+        while 1:
+            callback(self)
+
+
+def test_mongo_session_transaction_gives_up_after_retries(monkeypatch, mongo_store):
+    mongo_store._sessions = True
+    monkeypatch.setattr(mongo_store._db.database.client, 'start_session', RetryingSession, raising=False)
+    # mongomock does not accept sessions, so count the attempts rather than running them.
+    attempts = []
+    monkeypatch.setattr(mongo_store, '_session_transaction', lambda f, keys, session: attempts.append(1))
+
+    with pytest.raises(DAOError) as e:
+        mongo_store.transaction(lambda tx: None, ['a'])
+    assert e.value.code == 409
+    assert len(attempts) == TRANSACTION_RETRIES
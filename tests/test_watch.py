@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import threading
+
+import pytest
+
+from agaveflask.store import ChangeEvent
+
+
+def later(f, *args):
+    """Call f(*args) shortly, from another thread, once the watch has started."""
+    timer = threading.Timer(0.2, f, args)
+    timer.start()
+    return timer
+
+
+@pytest.fixture
+def publishing_store(config, redis_store):
+    config.parser.read_dict({'store': {'notifications': 'publish'}})
+    return redis_store
+
+
+@pytest.fixture
+def polling(config):
+    config.parser.read_dict({'store': {'watch_poll_ms': 20}})
+
+
+def test_redis_watch_keys(publishing_store):
+    later(publishing_store.__setitem__, 'actor1', {'status': 'READY'})
+    events = publishing_store.watch(['actor1'], timeout=5)
+    assert next(events) == ChangeEvent('actor1', 'set')
+    later(publishing_store.__delitem__, 'actor1')
+    assert next(events) == ChangeEvent('actor1', 'del')
+    events.close()
+
+
+def test_redis_watch_prefix(publishing_store):
+    def write():
+        publishing_store['other'] = 1
+        publishing_store['actor*2'] = 1
+
+    later(write)
+    events = publishing_store.watch('actor*', timeout=5)
+    assert next(events) == ChangeEvent('actor*2', 'set')
+    events.close()
+
+
+def test_redis_watch_transaction(publishing_store):
+    later(publishing_store.transaction, lambda tx: tx.__setitem__('actor1', 1), ['actor1'])
+    assert next(publishing_store.watch(['actor1'], timeout=5)) == ChangeEvent('actor1', 'set')
+
+
+def test_watch_timeout(publishing_store):
+    assert list(publishing_store.watch(['actor1'], timeout=0.1)) == []
+
+
+def test_mongo_watch_falls_back_to_polling(polling, mongo_store):
+    mongo_store['actor1'] = 1
+    later(mongo_store.__setitem__, 'actor1', 2)
+    events = mongo_store.watch('actor', timeout=5)
+    assert next(events) == ChangeEvent('actor1', 'set')
+    later(mongo_store.__delitem__, 'actor1')
+    assert next(events) == ChangeEvent('actor1', 'del')
+    events.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='asyncio.run() needs Python 3.7+')
+def test_awatch(publishing_store):
+    async def first_event():
+        watcher = publishing_store.awatch(['actor1'], timeout=5)
+        try:
+            async for event in watcher:
+                return event
+        finally:
+            watcher.close()
+
+    later(publishing_store.__setitem__, 'actor1', 1)
+    assert asyncio.run(first_event()) == ChangeEvent('actor1', 'set')
+
+
+def test_watch_stops_when_stop_is_set(publishing_store):
+    stop = threading.Event()
+    later(stop.set)
+    assert list(publishing_store.watch(['actor1'], stop=stop)) == []
+
+
+def test_polling_watch_stops_when_stop_is_set(polling, mongo_store):
+    stop = threading.Event()
+    later(stop.set)
+    assert list(mongo_store.watch(['actor1'], stop=stop)) == []
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='asyncio.run() needs Python 3.7+')
+def test_awatch_close_after_cancellation(publishing_store):
+    watcher = publishing_store.awatch(['actor1'])
+
+    async def wait_briefly():
+        try:
+            await asyncio.wait_for(watcher.__anext__(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+        watcher.close()
+
+    asyncio.run(wait_briefly())
+    watcher._thread.join(2)
+    assert not watcher._thread.is_alive()
+
+
+def test_redis_watch_publishes_by_default(redis_store):
+    assert redis_store.notifications == 'publish'
+    later(redis_store.__setitem__, 'actor1', 1)
+    assert next(redis_store.watch(['actor1'], timeout=5)) == ChangeEvent('actor1', 'set')
+
+
+def test_redis_watch_polls_without_keyspace_notifications(config, polling, redis_store):
+    config.parser.read_dict({'store': {'notifications': 'keyspace'}})
+    redis_store._db.config_get = lambda pattern: {'notify-keyspace-events': ''}
+    redis_store['actor1'] = 1
+    later(redis_store.__setitem__, 'actor1', 2)
+    assert next(redis_store.watch(['actor1'], timeout=5)) == ChangeEvent('actor1', 'set')
+
+
+def test_redis_publishes_with_the_write(monkeypatch, publishing_store):
+    publishing_store['actor1'] = 1
+    commands = []
+    monkeypatch.setattr(publishing_store._db, 'execute_command', lambda *args, **kwargs: commands.append(args))
+    publishing_store['actor1'] = 2
+    del publishing_store['actor1']
+    # the writes and their notifications went through pipelines, not one command at a time.
+    assert commands == []
+
+
+def test_redis_getset_publishes(publishing_store):
+    publishing_store['actor1'] = 1
+    later(publishing_store.getset, 'actor1', 2)
+    assert next(publishing_store.watch(['actor1'], timeout=5)) == ChangeEvent('actor1', 'set')
+    assert publishing_store.getset('actor1', 3) == 2
+
+
+def test_polling_watch_filters_prefix_in_backend(monkeypatch, polling, redis_store):
+    redis_store['actor1'] = 1
+    redis_store['worker1'] = 1
+    monkeypatch.setattr(type(redis_store), '__iter__', lambda self: pytest.fail('iterated over the whole store'))
+    assert redis_store._keys_with_prefix('actor') == ['actor1']
+    later(redis_store.__setitem__, 'actor2', 1)
+    assert next(super(type(redis_store), redis_store).watch('actor', timeout=5)) == ChangeEvent('actor2', 'set')
+
+
+def test_mongo_keys_with_prefix(monkeypatch, mongo_store):
+    mongo_store['actor.1'] = 1
+    mongo_store['actorx1'] = 1
+    monkeypatch.setattr(type(mongo_store), '__iter__', lambda self: pytest.fail('iterated over the whole store'))
+    assert mongo_store._keys_with_prefix('actor.') == ['actor.1']